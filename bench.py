@@ -0,0 +1,255 @@
+"""Micro-benchmarks for cart parsing, order-sheet ingestion and part submission.
+
+    python bench.py                                  # all benchmarks at 10..10000 lines
+    python bench.py --sizes 100 1000 --only parse_mc
+    python bench.py --save bench_baseline.json       # record a baseline
+    python bench.py --compare bench_baseline.json    # exit 1 if anything regressed
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import extract
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+# Markup around the cart that real saved pages carry, so parsers have something to skip
+FILLER = '<div class="nav"><ul>' + '<li><a href="/c/{0}">Category {0}</a></li>' * 20 + '</ul></div>'
+
+
+def synthetic_ms_cart(lines, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for i in range(lines):
+        width = f'<input class="pro_width form-control" value="{rng.randint(1, 48)}">' if i % 3 == 0 else ''
+        items.append(
+            f'<div id="cartitem_{i}" class="cart-item">'
+            f'<h3 class="product-name">Aluminum Flat Bar {i % 50}</h3>'
+            f'<p class="product-info">6061-T6 {rng.choice(["1/4", "1/2", "3/4"])}" x {rng.randint(1, 6)}"</p>'
+            f'<input name="pro_sku" value="MS{i:06d}">'
+            f'<input class="pro_length form-control" value="{rng.randint(6, 144)}">{width}'
+            f'<input name="sel_quantity" value="{rng.randint(1, 10)}">'
+            f'<input name="price_value" value="{rng.uniform(5, 500):.2f}">'
+            f'</div>{FILLER.format(i)}'
+        )
+    return f'<html><head><meta charset="utf-8"><title>Cart</title></head><body>{"".join(items)}</body></html>'
+
+
+def synthetic_mc_cart(lines, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for i in range(lines):
+        extra = f'<span class="inline-spec-attribute-text-with-input">Length: {rng.randint(1, 36)}"</span>' if i % 4 == 0 else ''
+        items.append(
+            f'<div class="order-pad-line">'
+            f'<input id="line-part-number-input-{i}" value="{rng.randint(1000, 99999)}A{i % 1000}">'
+            f'<input id="line-quantity-input-{i}" value="{rng.randint(1, 25)}">'
+            f'<div class="line-unit-price">${rng.uniform(0.1, 90):.2f} each</div>'
+            f'<div class="line-title title-text">Socket Head Screw {i}</div>'
+            f'<div class="line-description description-print--view">Black-Oxide Alloy Steel, M{rng.randint(2, 12)}</div>'
+            f'{extra}</div>{FILLER.format(i)}'
+        )
+    return f'<html><head><meta charset="utf-8"><title>Order</title></head><body>{"".join(items)}</body></html>'
+
+
+def synthetic_order_sheet(lines, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(lines):
+        if i % 2:
+            vendor, part, dims, link = 'MetalSupermarkets', f'MS{i:06d}', f'{rng.randint(6, 144)} X {rng.randint(1, 48)}', f'https://www.metalsupermarkets.com/product/bar-{i % 50}'
+        else:
+            vendor, part, dims, link = 'McMaster', f'{rng.randint(1000, 99999)}A{i % 1000}', '', f'https://mcmaster.com/{i}'
+        rows.append(f'FALSE||TRUE||Student {i % 7}||Suspension||{vendor}||{part}||Part {i}||{rng.uniform(1, 90):.2f}||{rng.randint(1, 10)}||{dims}||{link}')
+    return rows
+
+
+class FakeFormHandler(BaseHTTPRequestHandler):
+    """Accepts every form submission, optionally after a delay"""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_form(latency=0.0):
+    handler = type('Handler', (FakeFormHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def measure(fn, lines, repeat):
+    """Time fn over repeat runs, then run it once more under tracemalloc for peak memory"""
+    fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(runs)
+    return {
+        'lines': lines,
+        'throughput': round(lines / best, 1),
+        'p50_ms': round(percentile(runs, 50) * 1000, 3),
+        'p95_ms': round(percentile(runs, 95) * 1000, 3),
+        'p99_ms': round(percentile(runs, 99) * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def bench_parse(vendor, backend):
+    make_cart = synthetic_ms_cart if vendor == 'ms' else synthetic_mc_cart
+    parse = getattr(extract, f'html_{vendor}_{backend}')
+
+    def run(lines, repeat):
+        html = make_cart(lines)
+        return measure(lambda: parse(html), lines, repeat)
+    return run
+
+
+def bench_parse_stream(vendor):
+    make_cart = synthetic_ms_cart if vendor == 'MetalSupermarkets' else synthetic_mc_cart
+
+    def run(lines, repeat):
+        fd, path = tempfile.mkstemp(suffix='.html')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(make_cart(lines))
+        try:
+            return measure(lambda: list(extract.iter_cart_items(vendor, path)), lines, repeat)
+        finally:
+            os.remove(path)
+    return run
+
+
+def bench_ingest(lines, repeat):
+    sheet = synthetic_order_sheet(lines)
+    return measure(lambda: extract.raw_to_array(sheet), lines, repeat)
+
+
+def bench_submit(lines, repeat, latency=0.0):
+    server = start_fake_form(latency)
+    old_link = os.environ.get('SUBMIT_FORM_LINK')
+    os.environ['SUBMIT_FORM_LINK'] = f'http://127.0.0.1:{server.server_port}/form?part={{part_number}}&qty={{quantity}}&name={{name}}'
+    data = extract.html_mc_lxml(synthetic_mc_cart(lines))
+    request_latencies = []
+
+    def run():
+        result = extract.submit('McMaster', data, 'bench', 'bench')
+        request_latencies.extend(part['latency'] for part in result['parts'])
+
+    # submit prints and logs every part; keep that out of the numbers
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    extract.logging.disable(extract.logging.WARNING)
+    try:
+        result = measure(run, lines, repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        extract.logging.disable(extract.logging.NOTSET)
+        server.shutdown()
+        if old_link is None:
+            os.environ.pop('SUBMIT_FORM_LINK', None)
+        else:
+            os.environ['SUBMIT_FORM_LINK'] = old_link
+
+    result['request_p50_ms'] = round(percentile(request_latencies, 50) * 1000, 3)
+    result['request_p99_ms'] = round(percentile(request_latencies, 99) * 1000, 3)
+    return result
+
+
+BENCHMARKS = {
+    'parse_ms_lxml': bench_parse('ms', 'lxml'),
+    'parse_ms_bs4': bench_parse('ms', 'bs4'),
+    'parse_mc_lxml': bench_parse('mc', 'lxml'),
+    'parse_mc_bs4': bench_parse('mc', 'bs4'),
+    'parse_ms_stream': bench_parse_stream('MetalSupermarkets'),
+    'parse_mc_stream': bench_parse_stream('McMaster'),
+    'ingest_raw_to_array': bench_ingest,
+    'submit': bench_submit,
+}
+
+
+def compare(results, baseline, tolerance):
+    """Regressions where throughput fell or peak memory grew by more than tolerance"""
+    regressions = []
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if not base:
+                continue
+            if result['throughput'] < base['throughput'] * (1 - tolerance):
+                regressions.append(f'{name}[{size}] throughput {base["throughput"]} -> {result["throughput"]} lines/s')
+            if result['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+                regressions.append(f'{name}[{size}] peak memory {base["peak_kb"]} -> {result["peak_kb"]} KB')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE', help='write results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before a regression (default 0.2)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f'{"benchmark":<22}{"lines":>7}{"lines/s":>12}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"peak KB":>11}')
+    for name in args.only or BENCHMARKS:
+        results[name] = {}
+        for size in args.sizes:
+            # Fewer repeats for the slow end so a full run stays in minutes
+            repeat = max(1, args.repeat if size < 10000 else args.repeat // 2)
+            result = BENCHMARKS[name](size, repeat)
+            results[name][str(size)] = result
+            print(f'{name:<22}{size:>7}{result["throughput"]:>12}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["p99_ms"]:>10}{result["peak_kb"]:>11}')
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,90 @@
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException, NoSuchElementException
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 import time
 import dotenv, os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from selenium.webdriver.common.action_chains import ActionChains
 
 import extract
+import metrics
+import ms_http
+import planner
+import session_cache
+from cart import CartBatch
+from driver_pool import DriverPool
+from metrics import no_progress
+from waits import AdaptiveWait, Timings, network_idle
 
 dotenv.load_dotenv()
 
-def get_driver_wait():
-    CHROME_BROWSER_PATH = '/opt/google/chrome/google-chrome'
-    CHROMEDRIVER_PATH = '/home/dhvan/Documents/baja-auto-order/chromedriver'
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', 1))
+DRIVER_MAX_USES = int(os.getenv('DRIVER_MAX_USES', 20))
+# A pooled driver unused this many seconds has its login checked again before it is lent out
+DRIVER_IDLE_CHECK = int(os.getenv('DRIVER_IDLE_CHECK', 300))
+# Number of drivers MetalSupermarkets items are split across, capped by the pool size
+MS_SHARDS = int(os.getenv('MS_SHARDS', 1))
+# Most lines pasted into the McMaster order pad per submit
+MC_PASTE_CHUNK = int(os.getenv('MC_PASTE_CHUNK', 50))
+# 'http' posts cart adds directly and only uses the browser for items that fail
+MS_CART_ENGINE = os.getenv('MS_CART_ENGINE', 'selenium')
+# 'delta' reads each vendor's cart first and only adds what it doesn't already have
+CART_MODE = os.getenv('CART_MODE', 'full')
+# Extra attempts for an item that fails to cart before it is reported as failed
+CART_ITEM_RETRIES = int(os.getenv('CART_ITEM_RETRIES', 2))
+
+MS_BASE_URL = os.getenv('MS_BASE_URL', 'https://www.metalsupermarkets.com')
+MC_BASE_URL = os.getenv('MC_BASE_URL', 'https://www.mcmaster.com')
+# Longest mc_logged_in waits for McMaster's header to show whether the session is logged in
+MC_LOGIN_CHECK_TIMEOUT = 10
+MC_LOGIN_LINK = (By.ID, 'LoginUsrCtrlWebPart_LoginLnk')
+MC_LOGOUT_LINK = (By.XPATH, '//a[contains(translate(normalize-space(.), "LOGUT", "logut"), "log out")]')
+
+# Resource types the lean profile blocks, as file extensions
+LEAN_BLOCKED_TYPES = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': ('mp4', 'webm', 'mp3', 'ogg'),
+}
+# Third-party analytics, ads, embeds and consent hosts the lean profile blocks, subdomains included
+LEAN_BLOCKED_HOSTS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'googleadservices.com', 'facebook.net', 'facebook.com', 'hotjar.com', 'clarity.ms', 'bing.com',
+    'linkedin.com', 'licdn.com', 'hs-scripts.com', 'hs-analytics.net', 'hubspot.com', 'youtube.com',
+    'ytimg.com', 'vimeo.com', 'fonts.googleapis.com', 'fonts.gstatic.com', 'cookiebot.com',
+    'nr-data.net', 'criteo.com', 'adsrvr.org', 'quantserve.com', 'pinterest.com', 'tiktok.com',
+)
+# Blocked types or hosts a vendor's login and cart flows still need
+LEAN_ALLOWED = {
+    # The login page's consent banner comes from Cookiebot and accept_cookie_banner dismisses it
+    'MetalSupermarkets': ('cookiebot.com',),
+    'McMaster': (),
+}
+
+def lean_blocked_urls(vendor=None):
+    """Network.setBlockedURLs patterns for the lean profile, minus the vendor's allowlist"""
+    allowed = LEAN_ALLOWED.get(vendor, ())
+    extra_hosts = [host.strip() for host in os.getenv('BROWSER_BLOCK_HOSTS', '').split(',') if host.strip()]
+
+    urls = []
+    for resource_type, extensions in LEAN_BLOCKED_TYPES.items():
+        if resource_type not in allowed:
+            urls.extend(pattern for ext in extensions for pattern in (f'*.{ext}', f'*.{ext}?*'))
+    for host in (*LEAN_BLOCKED_HOSTS, *extra_hosts):
+        if not any(host == name or host.endswith(f'.{name}') for name in allowed):
+            urls.extend((f'*://{host}/*', f'*://*.{host}/*'))
+    return urls
+
+def get_driver_wait(vendor=None):
+    CHROME_BROWSER_PATH = os.getenv('CHROME_BROWSER_PATH', '/opt/google/chrome/google-chrome')
+    CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', '/home/dhvan/Documents/baja-auto-order/chromedriver')
+    # 'lean' returns from driver.get at DOMContentLoaded, skips images, fonts, media and trackers and caps the JS heap
+    BROWSER_PROFILE = os.getenv('BROWSER_PROFILE', 'default')
 
     chrome_options = Options()
     chrome_options.binary_location = CHROME_BROWSER_PATH
@@ -27,187 +95,331 @@ def get_driver_wait():
     chrome_options.add_experimental_option('useAutomationExtension', False)
     chrome_options.add_argument("user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
 
+    if BROWSER_PROFILE == 'lean':
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_argument(f"--js-flags=--max-old-space-size={int(os.getenv('BROWSER_JS_HEAP_MB', 512))}")
+
     chrome_service = Service(executable_path=CHROMEDRIVER_PATH)
     driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
 
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    wait = WebDriverWait(driver, 20)
+    if BROWSER_PROFILE == 'lean':
+        # Blocked requests fail straight away, so the page never waits on them
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': lean_blocked_urls(vendor)})
+
+    wait = AdaptiveWait(driver, 20)
 
     return driver, wait
 
+def page_idle():
+    """network_idle for the browser profile: lean drivers stop at DOMContentLoaded and skip
+    the subresources 'complete' waits for, so an 'interactive' page is ready enough"""
+    if os.getenv('BROWSER_PROFILE', 'default') == 'lean':
+        return network_idle(ready_states=('interactive', 'complete'))
+    return network_idle()
+
+COOKIE_ACCEPT_SELECTORS = [
+    "//button[@id='CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll']",
+    "//button[contains(@class, 'CybotCookiebotDialogBodyButton')]",
+    "//button[contains(text(), 'Accept')]",
+    "//button[contains(text(), 'Allow all')]",
+    "//a[@id='CybotCookiebotDialogBodyLevelButtonAccept']"
+]
+
+# Checks every selector in priority order in a single round trip
+FIND_COOKIE_BUTTON_JS = """
+for (const selector of arguments[0]) {
+    const el = document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (el && el.offsetParent !== null) return el;
+}
+return null;
+"""
+
 def accept_cookie_banner(driver):
     try:
         print("-> Looking for cookie banner...")
 
-        cookie_accept_selectors = [
-            "//button[@id='CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll']",
-            "//button[contains(@class, 'CybotCookiebotDialogBodyButton')]",
-            "//button[contains(text(), 'Accept')]",
-            "//button[contains(text(), 'Allow all')]",
-            "//a[@id='CybotCookiebotDialogBodyLevelButtonAccept']"
-        ]
-        
-        cookie_button_found = False
-        for selector in cookie_accept_selectors:
-            try:
-                cookie_button = driver.find_element(By.XPATH, selector)
-                if cookie_button.is_displayed():
-                    cookie_button.click()
-                    print("-> Cookie banner accepted.")
-                    cookie_button_found = True
-                    time.sleep(1) 
-                    break
-            except NoSuchElementException:
-                continue
-        
-        if not cookie_button_found:
+        cookie_button = driver.execute_script(FIND_COOKIE_BUTTON_JS, COOKIE_ACCEPT_SELECTORS)
+        if cookie_button is None:
             print("-> No cookie banner found or already dismissed.")
+            return
+
+        cookie_button.click()
+        AdaptiveWait(driver, 5).until(EC.invisibility_of_element(cookie_button))
+        print("-> Cookie banner accepted.")
             
     except Exception as e:
         print(f"-> Cookie banner handling skipped: {e}")
 
+def ms_logged_in(driver):
+    """A stale session can be shown the login form on /my-account without a redirect, so look for the form too"""
+    driver.get(f'{MS_BASE_URL}/my-account')
+    if '/my-account' not in driver.current_url:
+        return False
+    return not driver.find_elements(By.NAME, 'msm_email')
+
 def ms_login(driver, wait):
-    driver.get('https://metalsupermarkets.com/login')
+    account = os.getenv('MS_USERNAME')
+    if session_cache.restore(driver, 'MetalSupermarkets', account, MS_BASE_URL):
+        if ms_logged_in(driver):
+            print("-> Restored MetalSupermarkets session")
+            return
+        session_cache.clear('MetalSupermarkets', account)
+
+    driver.get(f'{MS_BASE_URL}/login')
     accept_cookie_banner(driver)
 
     MAX_LOGIN_ATTEMPTS = 3
     logged_in = False
+    confirm_wait = AdaptiveWait(driver, 5)
 
     for attempt in range(1, MAX_LOGIN_ATTEMPTS + 1):
         print(f"-> Attempting to log in (Attempt {attempt}/{MAX_LOGIN_ATTEMPTS})...")
         
         email_field = wait.until(EC.element_to_be_clickable((By.NAME, "msm_email")))
         email_field.clear()
-        for char in os.getenv('MS_USERNAME'):
-            email_field.send_keys(char)
-            time.sleep(0.05)
+        email_field.send_keys(account)
 
         password_field = wait.until(EC.element_to_be_clickable((By.NAME, "msm_password")))
         password_field.clear()
-        for char in os.getenv('MS_PASSWORD'):
-            password_field.send_keys(char)
-            time.sleep(0.05)
-            
-        time.sleep(1)
+        password_field.send_keys(os.getenv('MS_PASSWORD'))
 
         sign_in_button = driver.find_element(By.XPATH, "//form[@id='loginform']//button[@type='submit']")
         ActionChains(driver).move_to_element(sign_in_button).click().perform()
 
-        if(attempt > 1):
-            wait.until(EC.url_contains('/my-account'))
+        # Only submit again if the first attempt didn't land on the account page
+        try:
+            confirm_wait.until(EC.url_contains('/my-account'))
             logged_in = True
             break
-        else:
-            time.sleep(1)
+        except TimeoutException:
+            continue
             
     if not logged_in:
         print("Not logged in")
-        driver.quit()
-        exit()
+        raise RuntimeError('MetalSupermarkets login failed')
+
+    session_cache.save(driver, 'MetalSupermarkets', account)
+
+def mc_login_state(driver):
+    """'in' or 'out' once the header shows a log out or log in link, False while it is still rendering"""
+    if any(link.is_displayed() and 'log in' in link.text.lower() for link in driver.find_elements(*MC_LOGIN_LINK)):
+        return 'out'
+    if any(link.is_displayed() for link in driver.find_elements(*MC_LOGOUT_LINK)):
+        return 'in'
+    return False
+
+def mc_logged_in(driver):
+    """Wait for the header to show which it is, since a header that hasn't rendered has no log in link either"""
+    try:
+        state = AdaptiveWait(driver, MC_LOGIN_CHECK_TIMEOUT, ignored_exceptions=(StaleElementReferenceException,)).until(mc_login_state)
+    except TimeoutException:
+        print('-> McMaster header showed neither a log in nor a log out link, taking the session as logged out')
+        return False
+    return state == 'in'
+
+def mc_session_valid(driver):
+    """Load the home page and check the session there, for a driver that has been sitting idle"""
+    driver.get(MC_BASE_URL)
+    return mc_logged_in(driver)
 
 def mc_login(driver, wait):
-    driver.get('https://www.mcmaster.com/')
+    account = os.getenv('MC_USERNAME')
+    if session_cache.restore(driver, 'McMaster', account, MC_BASE_URL):
+        driver.get(MC_BASE_URL)
+        if mc_logged_in(driver):
+            print("-> Restored McMaster session")
+            return
+        session_cache.clear('McMaster', account)
 
-    time.sleep(1)
+    driver.get(MC_BASE_URL)
 
-    login_button = wait.until(EC.element_to_be_clickable((By.ID, "LoginUsrCtrlWebPart_LoginLnk")))
+    login_button = wait.until(EC.element_to_be_clickable(MC_LOGIN_LINK))
     login_button.click()
 
     email_field = wait.until(EC.element_to_be_clickable((By.ID, "Email")))
     email_field.clear()
-    for char in os.getenv('MC_USERNAME'):
-        email_field.send_keys(char)
-        time.sleep(0.05)
+    email_field.send_keys(account)
 
     password_field = wait.until(EC.element_to_be_clickable((By.ID, "Password")))
     password_field.clear()
-    for char in os.getenv('MC_PASSWORD'):
-        password_field.send_keys(char)
-        time.sleep(0.05)
-
-    time.sleep(1)
+    password_field.send_keys(os.getenv('MC_PASSWORD'))
 
     sign_in_button = driver.find_element(By.XPATH, "//input[@type='submit' and @value='Log in']")
     ActionChains(driver).move_to_element(sign_in_button).click().perform()
 
-    time.sleep(2)
+    wait.until(EC.staleness_of(sign_in_button))
+    wait.until(page_idle())
 
+    if not mc_logged_in(driver):
+        raise RuntimeError('McMaster login failed')
     print("-> Logged In")
+    session_cache.save(driver, 'McMaster', account)
 
-# NEEDS pro_link, pro_sku, pro_width, pro_length, sel_quantity
-def ms_add_to_cart(driver, wait, data):
-    for item in data:
-        item_details = {prop[0]: prop[1] for prop in item}
-        print(f"Processing: ({item_details['pro_sku']})")
+def item_outcome(line, attempts, error=None):
+    """Progress fields for an item that landed or failed, with the order rows the job checkpoints it under"""
+    fields = {'vendor': line.vendor, 'part_number': line.part_number, 'rows': list(line.rows or ()), 'attempts': attempts}
+    if error is not None:
+        fields['error'] = str(error)
+    return fields
 
+class AddUnconfirmed(Exception):
+    """An add failed after its add-to-cart click, so the line may already be in the cart"""
+
+def cart_item(line, add, progress, cause):
+    """Call add() to cart line, retrying up to CART_ITEM_RETRIES more times. Returns whether it landed.
+
+    Only failures before the click are retried; retrying after one could cart the line twice.
+    """
+    for attempt in range(1, CART_ITEM_RETRIES + 2):
         try:
-            driver.get(item_details['pro_link'])
-            item_sku = item_details['pro_sku']
-            xpath_selector = f"//tr[.//input[@name='pro_sku' and @value='{item_sku}']]"
-            product_row = wait.until(EC.presence_of_element_located((By.XPATH, xpath_selector)))
-
-            if 'pro_width' in item_details:
-                width_input = product_row.find_element(By.CLASS_NAME, 'pro_width')
-                width_input.clear()
-                width_input.send_keys(item_details['pro_width'])
-
-            length_input = product_row.find_element(By.CLASS_NAME, 'pro_length')
-            length_input.clear()
-            length_input.send_keys(item_details['pro_length'])
-
-            quantity_input = product_row.find_element(By.CLASS_NAME, 'sel_quantity')
-            quantity_input.clear()
-            quantity_input.send_keys(item_details['sel_quantity'])
-
-            time.sleep(1)
-
-            print("-> Waiting for button overlay to disappear...")
-            button_cell = product_row.find_element(By.CLASS_NAME, 'productbtn')
-            loader_overlay = button_cell.find_element(By.CLASS_NAME, 'price-loader')
-            wait.until(EC.invisibility_of_element(loader_overlay))
-            print("-> Overlay gone. Button is clear.")
-
-            # 3. Now find the button and click it
-            add_to_cart_button = button_cell.find_element(By.CLASS_NAME, 'addtocart')
-            
-            driver.execute_script("arguments[0].click();", add_to_cart_button)
+            add()
+        except AddUnconfirmed as e:
+            metrics.failures.inc(cause=cause)
+            print(f"-> Clicked add for {line.part_number} but couldn't confirm it (attempt {attempt}), not retrying: {e}")
+            progress('item_failed', **item_outcome(line, attempt, e))
+            return False
+        except Exception as e:
+            metrics.failures.inc(cause=cause)
+            print(f"-> Failed to add {line.part_number} (attempt {attempt}): {e}")
+            error = e
+            continue
+        progress('item_added', **item_outcome(line, attempt))
+        return True
+    progress('item_failed', **item_outcome(line, attempt, error))
+    return False
+
+def ms_add_to_cart(driver, wait, data, timings=None, progress=no_progress):
+    """Add MsLines, which need pro_link, pro_sku, pro_length, sel_quantity and optionally pro_width"""
+    timings = timings or Timings()
+    for link, items in planner.group_by_page(data):
+        # Fill every row for this product in one visit, reloading only if an add navigated away
+        page_url = None
+        for item in items:
+            def add_row(line=item):
+                nonlocal page_url
+                try:
+                    page_url = ms_add_row(driver, wait, link, page_url, line, timings)
+                except Exception:
+                    # Retry on a fresh load in case the failure left the row half filled
+                    page_url = None
+                    raise
+            cart_item(item, add_row, progress, 'ms_cart_item')
+
+def ms_add_row(driver, wait, link, page_url, line, timings):
+    """Add one MsLine on the product page, loading it unless it's still open. Returns the open page's URL"""
+    print(f"Processing: ({line.pro_sku})")
+
+    if page_url is None or driver.current_url != page_url:
+        with timings.step('page load'):
+            driver.get(link)
+        page_url = driver.current_url
+    item_sku = line.pro_sku
+    xpath_selector = f"//tr[.//input[@name='pro_sku' and @value='{item_sku}']]"
+    with timings.step('row found'):
+        product_row = wait.until(EC.presence_of_element_located((By.XPATH, xpath_selector)))
+
+    with timings.step('inputs filled'):
+        if line.pro_width is not None:
+            width_input = product_row.find_element(By.CLASS_NAME, 'pro_width')
+            width_input.clear()
+            width_input.send_keys(line.pro_width)
+
+        length_input = product_row.find_element(By.CLASS_NAME, 'pro_length')
+        length_input.clear()
+        length_input.send_keys(line.pro_length)
+
+        quantity_input = product_row.find_element(By.CLASS_NAME, 'sel_quantity')
+        quantity_input.clear()
+        quantity_input.send_keys(line.sel_quantity)
+
+    print("-> Waiting for button overlay to disappear...")
+    with timings.step('overlay gone'):
+        button_cell = product_row.find_element(By.CLASS_NAME, 'productbtn')
+        loader_overlay = button_cell.find_element(By.CLASS_NAME, 'price-loader')
+        # The price refresh fires after the inputs change, so let it start and settle
+        wait.until(page_idle())
+        wait.until(EC.invisibility_of_element(loader_overlay))
+    print("-> Overlay gone. Button is clear.")
+
+    # 3. Now find the button and click it
+    with timings.step('add clicked'):
+        add_to_cart_button = button_cell.find_element(By.CLASS_NAME, 'addtocart')
+        driver.execute_script("arguments[0].click();", add_to_cart_button)
+        try:
+            wait.until(page_idle())
+        except Exception as e:
+            raise AddUnconfirmed(e) from e
 
-            print(f"-> Successfully added {item_details['pro_sku']} to cart.")
-            time.sleep(1)
-        except:
-            pass
+    print(f"-> Successfully added {line.pro_sku} to cart.")
+    return page_url
 
-# NEEDS: part_number, quantity, extra_attr
-def mc_add_to_cart(driver, wait, data):
+def mc_add_to_cart(driver, wait, data, timings=None, progress=no_progress):
+    """Add McLines one product page at a time, which needs link, quantity and extra_attr"""
+    timings = timings or Timings()
+    for line in data:
+        cart_item(line, lambda line=line: mc_add_line(driver, wait, line, timings), progress, 'mc_cart_item')
+
+def mc_add_line(driver, wait, line, timings):
     quantity_xpath = "//input[contains(@class, 'input-simple--qty')] | //label[contains(., 'Quantity')]/preceding-sibling::input"
     add_button_xpath = "//button[contains(@class, 'add-to-order-pd')] | //button[contains(., 'ADD TO ORDER')]"
-    for item in data:
-        item_details = {prop[0]: prop[1] for prop in item}
-        print(f"-> Processing: {item_details['part_number']}")
-        driver.get(item_details['link'])
-        
-        quantity_input = wait.until(
-            EC.presence_of_element_located((By.XPATH, quantity_xpath))
-        )
-        wait.until(EC.element_to_be_clickable(quantity_input))
-        quantity_input.clear()
-        quantity_input.send_keys(item_details['quantity'])
+    print(f"-> Processing: {line.part_number}")
+    with timings.step('page load'):
+        driver.get(line.link)
 
-        add_button = wait.until(
-            EC.presence_of_element_located((By.XPATH, add_button_xpath))
-        )
+    quantity_input = wait.until(
+        EC.presence_of_element_located((By.XPATH, quantity_xpath))
+    )
+    wait.until(EC.element_to_be_clickable(quantity_input))
+    quantity_input.clear()
+    quantity_input.send_keys(line.quantity)
+
+    add_button = wait.until(
+        EC.presence_of_element_located((By.XPATH, add_button_xpath))
+    )
+    with timings.step('add clicked'):
         wait.until(EC.element_to_be_clickable(add_button))
         add_button.click()
 
-        if(len(item) > 3):
-            wait.until(EC.element_to_be_clickable(add_button))
-            add_button.click()
-
-def mc_paste_cart(driver, wait, data):
-    driver.get('https://mcmaster.com/order')
-
-    short_wait = WebDriverWait(driver, 2)
+        if(line.extra_attr):
+            try:
+                wait.until(EC.element_to_be_clickable(add_button))
+                add_button.click()
+            except Exception as e:
+                raise AddUnconfirmed(e) from e
+
+# Sets a textarea's value the way a paste would, so the page's input handlers see it
+PASTE_TEXT_JS = """
+const textarea = arguments[0];
+const setValue = Object.getOwnPropertyDescriptor(HTMLTextAreaElement.prototype, 'value').set;
+setValue.call(textarea, arguments[1]);
+textarea.dispatchEvent(new Event('input', {bubbles: true}));
+textarea.dispatchEvent(new Event('change', {bubbles: true}));
+"""
+
+# [part number, quantity] of every order pad line, from the same inputs html_mc reads
+MC_PAD_QUANTITIES_JS = """
+return Array.from(document.querySelectorAll('[class="order-pad-line"]'), (line) => {
+    const part = line.querySelector('[id^="line-part-number-input"]');
+    const quantity = line.querySelector('[id^="line-quantity-input"]');
+    return [part ? part.value : '', quantity ? quantity.value : ''];
+});
+"""
+
+def mc_part_key(part_number):
+    return (part_number or '').strip().upper()
+
+def mc_order_pad_quantities(driver):
+    """Total quantity of each part number on the order pad"""
+    quantities = Counter()
+    for part_number, quantity in driver.execute_script(MC_PAD_QUANTITIES_JS):
+        quantities[mc_part_key(part_number)] += int(quantity) if str(quantity).strip().isdigit() else 0
+    return quantities
+
+def mc_open_bulk_input(driver, wait):
+    short_wait = AdaptiveWait(driver, 2)
 
     try:
         switch_button = short_wait.until(
@@ -229,39 +441,216 @@ def mc_paste_cart(driver, wait, data):
     # switch_button.click()
     driver.execute_script("arguments[0].click();", switch_button)
 
-    bulk_input = wait.until(
+    return wait.until(
         EC.element_to_be_clickable((By.ID, 'bulk-lines-textarea'))
     )
 
-    for item in data:
-        item_details = {prop[0]: prop[1] for prop in item}
-        bulk_input.send_keys(f'{item_details['part_number']}, {item_details['quantity']}\n')
-        print(f'Added item: {item_details["part_number"]}')
-
-    submit_button = wait.until(
-        EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'button-add-bulk-lines')]"))
-    )
-
-    submit_button.click()
-
-def metal_supermarkets(data):
-    driver, wait = get_driver_wait()
-    ms_login(driver, wait)
-    ms_add_to_cart(driver, wait, data)
-
-def mcmaster(data):
-    driver, wait = get_driver_wait()
-    mc_login(driver, wait)
-    mc_paste_cart(driver, wait, data)
-    # mc_add_to_cart(driver, wait, data)
+def mc_unconfirmed_lines(lines, gained):
+    """The lines not covered by the quantity each part gained on the order pad"""
+    gained = Counter(gained)
+    missing = []
+    for line in lines:
+        part, quantity = mc_part_key(line.part_number), int(line.quantity)
+        if gained[part] >= quantity:
+            gained[part] -= quantity
+        else:
+            missing.append(line)
+    return missing
+
+def mc_paste_lines(driver, wait, lines, timings):
+    """Paste lines into the order pad and submit them. Returns the lines whose quantity didn't show up on it"""
+    quantities_before = mc_order_pad_quantities(driver)
+    bulk_input = mc_open_bulk_input(driver, wait)
+
+    with timings.step('bulk lines pasted'):
+        bulk_text = ''.join(f'{line.part_number}, {line.quantity}\n' for line in lines)
+        driver.execute_script(PASTE_TEXT_JS, bulk_input, bulk_text)
+        print(f'Pasted {len(lines)} items')
+
+    with timings.step('bulk lines submitted'):
+        submit_button = wait.until(
+            EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'button-add-bulk-lines')]"))
+        )
 
-def add_to_cart(csv_data):
+        submit_button.click()
+        wait.until(page_idle())
+        # Confirm the lines landed before pasting any more. Pasting a part already on the pad
+        # (a delta top-up, say) raises that line's quantity instead of adding one, so go by
+        # the quantity each part gained rather than the line count
+        try:
+            wait.until(lambda d: not mc_unconfirmed_lines(lines, mc_order_pad_quantities(d) - quantities_before))
+            return []
+        except TimeoutException:
+            missing = mc_unconfirmed_lines(lines, mc_order_pad_quantities(driver) - quantities_before)
+            metrics.failures.inc(cause='mc_paste_incomplete')
+            print(f'-> {len(missing)} of {len(lines)} pasted lines not on the order pad after submitting')
+            return missing
+
+def mc_paste_cart(driver, wait, data, timings=None, progress=no_progress):
+    """Paste a CartBatch of McLines into the order pad in MC_PASTE_CHUNK sized chunks.
+
+    Lines that don't show up are pasted again, up to CART_ITEM_RETRIES more times. Returns how many lines landed.
+    """
+    timings = timings or Timings()
+    if not isinstance(data, CartBatch):
+        data = CartBatch('McMaster', data)
+    with timings.step('page load'):
+        driver.get(f'{MC_BASE_URL}/order')
+
+    failed = 0
+    for start in range(0, len(data), MC_PASTE_CHUNK):
+        chunk = list(data[start:start + MC_PASTE_CHUNK])
+        pending = chunk
+        for attempt in range(1, CART_ITEM_RETRIES + 2):
+            missing = mc_paste_lines(driver, wait, pending, timings)
+            missing_ids = {id(line) for line in missing}
+            for line in pending:
+                if id(line) not in missing_ids:
+                    progress('item_added', **item_outcome(line, attempt))
+            pending = missing
+            if not pending:
+                break
+            metrics.failures.inc(len(pending), cause='mc_cart_item')
+            print(f'-> {len(pending)} lines missing from the order pad after attempt {attempt}')
+
+        for line in pending:
+            progress('item_failed', **item_outcome(line, attempt, 'not on the order pad after pasting'))
+        failed += len(pending)
+        progress('bulk_pasted', vendor='McMaster', lines=len(chunk))
+
+    landed = len(data) - failed
+    if landed != len(data):
+        print(f'-> Expected {len(data)} new order pad lines, found {landed}')
+    return {'expected': len(data), 'landed': landed}
+
+pools = {
+    'MetalSupermarkets': DriverPool('MetalSupermarkets', partial(get_driver_wait, 'MetalSupermarkets'), ms_login, DRIVER_POOL_SIZE, DRIVER_MAX_USES,
+                                    logged_in=ms_logged_in, idle_check=DRIVER_IDLE_CHECK),
+    'McMaster': DriverPool('McMaster', partial(get_driver_wait, 'McMaster'), mc_login, DRIVER_POOL_SIZE, DRIVER_MAX_USES,
+                           logged_in=mc_session_valid, idle_check=DRIVER_IDLE_CHECK),
+}
+
+def warm_pools():
+    for pool in pools.values():
+        pool.warm_async()
+
+def shutdown_pools():
+    for pool in pools.values():
+        pool.shutdown()
+
+def shard_items(data, count):
+    """Split items into at most count shards, keeping rows for the same product page together"""
+    groups = [items for _, items in planner.group_by_page(data)]
+
+    shards = [[] for _ in range(max(1, count))]
+    for group in sorted(groups, key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return [shard for shard in shards if shard]
+
+def ms_shard(data, timings, progress=no_progress):
+    start = time.perf_counter()
+    with pools['MetalSupermarkets'].borrow() as (driver, wait):
+        timings.record('ms driver ready', time.perf_counter() - start)
+        progress('logged_in', vendor='MetalSupermarkets')
+        if MS_CART_ENGINE == 'http':
+            with ms_http.session_from_driver(driver) as session:
+                unsent, unconfirmed = ms_http.add_items(session, data, timings=timings)
+            metrics.failures.inc(len(unsent) + len(unconfirmed), cause='ms_http_item')
+            unsent_ids = {id(line) for line in unsent}
+            unconfirmed_ids = {id(line) for line in unconfirmed}
+            for line in data:
+                if id(line) in unconfirmed_ids:
+                    # It may have landed, so adding it again in the browser could double it
+                    progress('item_failed', **item_outcome(line, 1, 'sent over HTTP but not confirmed'))
+                elif id(line) not in unsent_ids:
+                    progress('item_added', **item_outcome(line, 1))
+            # Only adds that never reached the site are safe to retry
+            data = unsent
+            if data:
+                print(f'-> Falling back to the browser for {len(data)} items')
+        ms_add_to_cart(driver, wait, data, timings, progress)
+
+def metal_supermarkets(data, timings=None, progress=no_progress):
+    timings = timings or Timings()
+    shards = shard_items(data, min(MS_SHARDS, pools['MetalSupermarkets'].size))
+    if len(shards) <= 1:
+        for shard in shards:
+            ms_shard(shard, timings, progress)
+        return
+
+    print(f'-> Splitting {len(data)} MetalSupermarkets items across {len(shards)} drivers')
+    with ThreadPoolExecutor(max_workers=len(shards)) as shard_executor:
+        futures = [shard_executor.submit(ms_shard, shard, timings, progress) for shard in shards]
+    for future in futures:
+        future.result()
+
+def mcmaster(data, timings=None, progress=no_progress):
+    timings = timings or Timings()
+    start = time.perf_counter()
+    with pools['McMaster'].borrow() as (driver, wait):
+        timings.record('mc driver ready', time.perf_counter() - start)
+        progress('logged_in', vendor='McMaster')
+        return mc_paste_cart(driver, wait, data, timings, progress)
+        # mc_add_to_cart(driver, wait, data, timings, progress)
+
+def read_cart(vendor, timings, progress=no_progress):
+    """Quantities already in the vendor's cart (see planner.cart_quantities), or None if it can't be read"""
+    cart_url = f'{MS_BASE_URL}/cart' if vendor == 'MetalSupermarkets' else f'{MC_BASE_URL}/order'
+    parse = extract.html_ms if vendor == 'MetalSupermarkets' else extract.html_mc
+    try:
+        with pools[vendor].borrow() as (driver, wait):
+            with timings.step('cart read'):
+                driver.get(cart_url)
+                wait.until(page_idle())
+                page_source = driver.page_source
+        # Same parsers as uploaded cart pages
+        lines = parse(page_source)
+    except Exception as e:
+        metrics.failures.inc(cause=f'{vendor}_cart_read')
+        print(f'-> Could not read the {vendor} cart, adding every line: {e}')
+        return None
+    progress('cart_read', vendor=vendor, lines=len(lines))
+    return planner.cart_quantities(lines)
+
+def cart_vendor(vendor, order, timings, progress=no_progress):
+    """Plan and cart a vendor's whole order at once, so repeated parts merge and every product page loads once.
+    Returns the plan report"""
+    cart = metal_supermarkets if vendor == 'MetalSupermarkets' else mcmaster
+    in_cart = read_cart(vendor, timings, progress) if CART_MODE == 'delta' else None
+    lines, report, covered = planner.plan(vendor, order, {}, in_cart)
+    for line in covered:
+        progress('item_in_cart', **item_outcome(line, 0))
+    if lines:
+        pasted = cart(lines, timings, progress)
+        if pasted:
+            report['expected_lines'] = pasted['expected']
+            report['landed_lines'] = pasted['landed']
+    return report
+
+def add_to_cart(csv_data, progress=no_progress, carted_rows=()):
+    """Cart an order sheet, skipping the line numbers in carted_rows (already carted by an earlier run)"""
     print('-> Starting process')
-    ms, mc = extract.raw_to_array(csv_data)
-
-    if(len(ms) >= 1):
-        metal_supermarkets(ms)
-    if(len(mc) >= 1):
-        mcmaster(mc)
+    timings = Timings()
+    errors = []
+    skipped = []
+    resumed = 0
+
+    rows = extract.iter_order_rows(csv_data, errors=errors, skipped=skipped)
+    if carted_rows:
+        def uncarted(rows):
+            nonlocal resumed
+            for row in rows:
+                if row[0] in carted_rows:
+                    resumed += 1
+                else:
+                    yield row
+        rows = uncarted(rows)
+    orders = [order for order in extract.rows_to_array(rows) if len(order)]
+
+    # Vendors use separate drivers and accounts, so cart them side by side
+    with ThreadPoolExecutor(max_workers=2) as vendor_executor:
+        futures = [vendor_executor.submit(cart_vendor, order.vendor, order, timings, progress) for order in orders]
+    plans = {order.vendor: future.result() for order, future in zip(orders, futures)}
     
-    print('-> ALL DONE')
\ No newline at end of file
+    print('-> ALL DONE')
+    return {'timings': timings.as_dict(), 'plan': plans, 'invalid_rows': errors, 'skipped_rows': skipped, 'already_carted_rows': resumed}
\ No newline at end of file
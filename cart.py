@@ -0,0 +1,155 @@
+from dataclasses import dataclass, fields, replace
+from operator import attrgetter
+from typing import ClassVar, Optional
+
+
+def _join_rows(rows, other):
+    if rows is None or other is None:
+        return rows or other
+    return rows + other
+
+
+@dataclass(slots=True)
+class MsLine:
+    """A MetalSupermarkets line: the SKU's row on its product page and the cut to order"""
+    vendor: ClassVar[str] = 'MetalSupermarkets'
+
+    pro_sku: Optional[str] = None
+    sel_quantity: Optional[str] = None
+    pro_length: Optional[str] = None
+    pro_width: Optional[str] = None
+    pro_link: Optional[str] = None
+    pro_name: Optional[str] = None
+    pro_info: Optional[str] = None
+    # Any other inputs on a saved cart row, e.g. price_value
+    extra: Optional[dict] = None
+    # Order sheet line numbers this line carts, for the job checkpoint
+    rows: Optional[tuple] = None
+
+    @property
+    def part_number(self):
+        return self.pro_sku
+
+    @property
+    def quantity(self):
+        return self.sel_quantity
+
+    def with_quantity(self, quantity):
+        return replace(self, sel_quantity=quantity)
+
+    def merge(self, other):
+        """This line with other's quantity added and its order rows included"""
+        return replace(self, sel_quantity=str(int(self.sel_quantity) + int(other.sel_quantity)), rows=_join_rows(self.rows, other.rows))
+
+    def merge_key(self):
+        """Lines with the same key are the same cut of the same product"""
+        return (self.pro_link, self.pro_sku, self.pro_length, self.pro_width)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        values = {}
+        extra = {}
+        for key, value in pairs:
+            if key in MS_FIELDS:
+                values[key] = value
+            else:
+                extra[key] = value
+        return cls(extra=extra or None, **values)
+
+    def to_pairs(self):
+        pairs = [[key, getattr(self, key)] for key in MS_PAIR_ORDER if getattr(self, key) is not None]
+        if self.extra:
+            pairs.extend([key, value] for key, value in self.extra.items())
+        return pairs
+
+
+@dataclass(slots=True)
+class McLine:
+    """A McMaster line: a part number and quantity, plus what the order pad shows for it"""
+    vendor: ClassVar[str] = 'McMaster'
+
+    part_number: str
+    quantity: str
+    # Length, thread or other attribute entered with the part
+    extra_attr: Optional[str] = None
+    link: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[str] = None
+    rows: Optional[tuple] = None
+
+    def with_quantity(self, quantity):
+        return replace(self, quantity=quantity)
+
+    def merge(self, other):
+        return replace(self, quantity=str(int(self.quantity) + int(other.quantity)), rows=_join_rows(self.rows, other.rows))
+
+    def merge_key(self):
+        return (self.part_number, self.extra_attr)
+
+    def to_pairs(self):
+        # extra_attr is always present, as None when the part has none
+        return [[key, getattr(self, key)] for key in MC_PAIR_ORDER if key == 'extra_attr' or getattr(self, key) is not None]
+
+
+MS_FIELDS = frozenset(f.name for f in fields(MsLine)) - {'extra', 'rows'}
+# Key order of the [key, value] pairs the frontend receives
+MS_PAIR_ORDER = ('pro_name', 'pro_info', 'pro_link', 'pro_sku', 'pro_length', 'pro_width', 'sel_quantity')
+MC_PAIR_ORDER = ('title', 'description', 'part_number', 'quantity', 'price', 'extra_attr', 'link')
+LINE_TYPES = {'MetalSupermarkets': MsLine, 'McMaster': McLine}
+# Field names in constructor order, and a getter for all of them at once
+FIELD_NAMES = {line_type: tuple(f.name for f in fields(line_type)) for line_type in LINE_TYPES.values()}
+FIELD_GETTERS = {line_type: attrgetter(*names) for line_type, names in FIELD_NAMES.items()}
+
+
+class CartBatch:
+    """One vendor's lines stored column by column, one list per field"""
+    __slots__ = ('vendor', 'line_type', '_columns')
+
+    def __init__(self, vendor, lines=()):
+        self.vendor = vendor
+        self.line_type = LINE_TYPES[vendor]
+        self._columns = {name: [] for name in FIELD_NAMES[self.line_type]}
+        self.extend(lines)
+
+    @classmethod
+    def from_columns(cls, vendor, columns):
+        """A batch over columns as to_columns gives them"""
+        batch = cls(vendor)
+        batch._columns = columns
+        return batch
+
+    def append(self, line):
+        for column, value in zip(self._columns.values(), FIELD_GETTERS[self.line_type](line)):
+            column.append(value)
+
+    def extend(self, lines):
+        # Transpose rows of field values into the columns in one pass
+        rows = list(map(FIELD_GETTERS[self.line_type], lines))
+        if rows:
+            for column, values in zip(self._columns.values(), zip(*rows)):
+                column.extend(values)
+
+    def column(self, name):
+        """Every line's value for one field. Shared with the batch, so don't modify it"""
+        return self._columns[name]
+
+    def __len__(self):
+        return len(next(iter(self._columns.values())))
+
+    def __iter__(self):
+        line_type = self.line_type
+        return (line_type(*values) for values in zip(*self._columns.values()))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CartBatch.from_columns(self.vendor, {name: column[index] for name, column in self._columns.items()})
+        return self.line_type(*(column[index] for column in self._columns.values()))
+
+    def to_columns(self):
+        """Every field's column by name, plain lists that the job store can keep as JSON"""
+        return {name: list(column) for name, column in self._columns.items()}
+
+    def to_pairs(self):
+        """Legacy list of [key, value] pair lists, the shape job results have always had"""
+        return [line.to_pairs() for line in self]
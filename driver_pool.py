@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+import metrics
+
+
+class DriverPool:
+    """Pool of started, logged-in drivers for a single vendor"""
+
+    def __init__(self, vendor, create, login, size=2, max_uses=20, timeout=300, logged_in=None, idle_check=300):
+        """logged_in(driver), if given, re-checks the session of a driver borrowed after idle_check seconds unused"""
+        self.vendor = vendor
+        self.create = create
+        self.login = login
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.logged_in = logged_in
+        self.idle_check = idle_check
+
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._live = 0
+
+    @property
+    def live(self):
+        with self._lock:
+            return self._live
+
+    def _start(self):
+        driver, wait = self.create()
+        try:
+            self.login(driver, wait)
+        except BaseException:
+            metrics.failures.inc(cause=f'{self.vendor}_login')
+            driver.quit()
+            raise
+        with self._lock:
+            self._uses[id(driver)] = 0
+            self._last_used[id(driver)] = time.monotonic()
+        return driver, wait
+
+    def _quit(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            self._last_used.pop(id(driver), None)
+            self._live -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f'-> [{self.vendor}] Failed to quit driver: {e}')
+
+    def _reserve(self):
+        with self._lock:
+            if self._live < self.size:
+                self._live += 1
+                return True
+        return False
+
+    def _healthy(self, driver):
+        try:
+            driver.execute_script('return document.readyState')
+            return True
+        except WebDriverException:
+            return False
+
+    def _still_logged_in(self, driver, wait):
+        """Re-check, and if needed redo, the login of a driver idle long enough for its session to expire"""
+        with self._lock:
+            idle = time.monotonic() - self._last_used.get(id(driver), 0)
+        if self.logged_in is None or idle < self.idle_check:
+            return True
+        try:
+            if self.logged_in(driver):
+                return True
+            print(f'-> [{self.vendor}] Session expired after {idle:.0f}s idle, logging in again')
+            self.login(driver, wait)
+        except Exception as e:
+            metrics.failures.inc(cause=f'{self.vendor}_login')
+            print(f'-> [{self.vendor}] Failed to log in again: {e}')
+            return False
+        with self._lock:
+            self._last_used[id(driver)] = time.monotonic()
+        return True
+
+    def warm(self, count=None):
+        """Start and log in drivers up to count (default: pool size)"""
+        count = self.size if count is None else min(count, self.size)
+        while self.live < count and self._reserve():
+            try:
+                self._idle.put(self._start())
+            except Exception as e:
+                with self._lock:
+                    self._live -= 1
+                print(f'-> [{self.vendor}] Failed to warm driver: {e}')
+                break
+
+    def warm_async(self, count=None):
+        thread = threading.Thread(target=self.warm, args=(count,), daemon=True)
+        thread.start()
+        return thread
+
+    def acquire(self):
+        while True:
+            try:
+                driver, wait = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve():
+                    try:
+                        return self._start()
+                    except BaseException:
+                        with self._lock:
+                            self._live -= 1
+                        raise
+                try:
+                    driver, wait = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f'No {self.vendor} driver available after {self.timeout}s')
+
+            if not self._healthy(driver):
+                metrics.failures.inc(cause=f'{self.vendor}_driver_unhealthy')
+                print(f'-> [{self.vendor}] Dropping unhealthy driver')
+                self._quit(driver)
+            elif not self._still_logged_in(driver, wait):
+                self._quit(driver)
+            else:
+                return driver, wait
+
+    def release(self, driver, wait, discard=False):
+        with self._lock:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+            self._last_used[id(driver)] = time.monotonic()
+
+        if discard or uses >= self.max_uses or not self._healthy(driver):
+            self._quit(driver)
+        else:
+            self._idle.put((driver, wait))
+
+    @contextmanager
+    def borrow(self):
+        """Borrow a driver, discarding it if the caller raises"""
+        driver, wait = self.acquire()
+        try:
+            yield driver, wait
+        except BaseException:
+            self.release(driver, wait, discard=True)
+            raise
+        self.release(driver, wait)
+
+    def shutdown(self):
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
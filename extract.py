@@ -4,41 +4,275 @@ import bs4, csv
 from datetime import datetime
 import dotenv, os
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import re
+import multiprocessing
 import logging
+import time
+import hashlib
+import tempfile
+from urllib.parse import urlsplit
+from lxml import etree
+
+import jobstore, metrics
+from cart import CartBatch, McLine, MsLine
+from metrics import no_progress
 
 dotenv.load_dotenv()
 
+# 'lxml' (default) uses the precompiled XPath parsers below, 'bs4' the original BeautifulSoup ones
+EXTRACT_PARSER = os.getenv('EXTRACT_PARSER', 'lxml')
+
+SUBMIT_WORKERS = int(os.getenv('SUBMIT_WORKERS', 10))
+SUBMIT_RETRIES = int(os.getenv('SUBMIT_RETRIES', 4))
+SUBMIT_TIMEOUT = float(os.getenv('SUBMIT_TIMEOUT', 10))
+
+def make_submit_session(workers=SUBMIT_WORKERS, retries=SUBMIT_RETRIES):
+    """Keep-alive session that retries 429/5xx with exponential backoff"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        # A read error may come after the form recorded the row, so resending could add it twice
+        read=0,
+        other=0,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        # Hand back the last 5xx/429 once retries run out, so it fails with its status rather than a RetryError
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Shared by every job so connections are reused and total concurrency stays bounded
+submit_session = make_submit_session()
+submit_executor = ThreadPoolExecutor(max_workers=SUBMIT_WORKERS, thread_name_prefix='submit')
+
+# Worker processes for parsing uploads: 0 parses in the job's thread, 'auto' starts one per core
+EXTRACT_PROCESSES = os.getenv('EXTRACT_PROCESSES', '0')
+
+def parse_process_count(setting=EXTRACT_PROCESSES):
+    if setting == 'auto':
+        return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return int(setting)
+
+parse_pool = None
+
+def start_parse_pool(processes=None):
+    """Start the parse worker processes. Call at boot, before any threads, since workers are forked"""
+    global parse_pool
+    processes = parse_process_count() if processes is None else processes
+    if parse_pool is not None or processes < 1:
+        return parse_pool
+
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'))
+    # The first task forks every worker, so do it now while this process is still single threaded
+    pool.submit(int).result()
+    parse_pool = pool
+    print(f'-> Started {processes} parse processes')
+    return pool
+
+def stop_parse_pool():
+    global parse_pool
+    if parse_pool is not None:
+        parse_pool.shutdown(cancel_futures=True)
+        parse_pool = None
+
+class CartExtraction:
+    """Parse result for one uploaded cart, with which of its form requests have been sent kept in the job store.
+
+    Keyed by a hash of the vendor and upload, so a re-upload to any process or rq worker skips resubmission.
+    """
+
+    def __init__(self, key, data, store):
+        self.key = key
+        self.data = data
+        self.store = store
+
+    @staticmethod
+    def _part(key):
+        position, link = key
+        return f'{position}:{link}'
+
+    def claim(self, keys):
+        """Mark keys as sent, returning only those that weren't already"""
+        parts = {self._part(key): key for key in keys}
+        return {parts[part] for part in self.store.claim_parts(self.key, parts)}
+
+    def release(self, keys):
+        self.store.release_parts(self.key, [self._part(key) for key in keys])
+
+def content_key(vendor, input_content):
+    if isinstance(input_content, str):
+        input_content = input_content.encode('utf-8')
+    return f'{vendor}:{hashlib.sha256(input_content).hexdigest()}'
+
+def _has_class(name):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+MS_CART_ITEMS = etree.XPath('//*[starts-with(@id, "cartitem_")]')
+MS_ITEM_NAME = etree.XPath(f'(.//h3[{_has_class("product-name")}])[1]')
+MS_ITEM_INFO = etree.XPath(f'(.//p[{_has_class("product-info")}])[1]')
+MS_ITEM_INPUTS = etree.XPath('.//input')
+
+MC_CART_ITEMS = etree.XPath('//*[@class="order-pad-line"]')
+MC_PART_NUMBER = etree.XPath('(.//*[starts-with(@id, "line-part-number-input")])[1]')
+MC_QUANTITY = etree.XPath('(.//*[starts-with(@id, "line-quantity-input")])[1]')
+MC_PRICE = etree.XPath('(.//*[contains(@class, "line-unit-price")])[1]')
+MC_TITLE = etree.XPath('(.//*[contains(@class, "title-text")])[1]')
+MC_DESCRIPTION = etree.XPath('(.//*[contains(@class, "description-print--view")])[1]')
+MC_EXTRA_ATTR = etree.XPath('(.//*[@class="inline-spec-attribute-text-with-input"])[1]')
+
+def _parse_html(input_content):
+    if isinstance(input_content, str):
+        input_content = input_content.encode('utf-8')
+    return etree.fromstring(input_content, etree.HTMLParser(encoding='utf-8'))
+
+def _cart_items(items_xpath, input_content):
+    """Item elements in a page; an empty page (no root element) has none, as with bs4"""
+    root = _parse_html(input_content)
+    return items_xpath(root) if root is not None else []
+
+def _string(element):
+    """Same rules as bs4's Tag.string: descend through only-children, None if there is more than one"""
+    while True:
+        if len(element) == 0:
+            return element.text
+        if len(element) > 1 or element.text or element[0].tail:
+            return None
+        element = element[0]
+
+def _text(element):
+    """Same rules as bs4's get_text: descendant text, skipping comments and script/style/template"""
+    parts = [element.text or '']
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in ('script', 'style', 'template'):
+            parts.append(_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
 def html_ms(input_content):
+    if EXTRACT_PARSER == 'bs4':
+        return html_ms_bs4(input_content)
+    return html_ms_lxml(input_content)
+
+def html_mc(input_content):
+    if EXTRACT_PARSER == 'bs4':
+        return html_mc_bs4(input_content)
+    return html_mc_lxml(input_content)
+
+def ms_item_lxml(item):
+    item_name = _string(MS_ITEM_NAME(item)[0])
+    item_info = _string(MS_ITEM_INFO(item)[0])
+    output_item = [
+        ('pro_name', item_name),
+        ('pro_info', item_info),
+        ('pro_link', f'https://www.metalsupermarkets.com/product/{item_name.lower().replace(" ", "-")}')
+    ]
+    for input in MS_ITEM_INPUTS(item):
+        attrs = input.attrib
+        try:
+            output_item.append((attrs['name'], attrs['value']))
+        except KeyError:
+            output_item.append((attrs['class'].split()[0], attrs['value']))
+    return MsLine.from_pairs(output_item)
+
+def mc_item_lxml(item):
+    part_number = MC_PART_NUMBER(item)[0].attrib['value']
+    quantity = MC_QUANTITY(item)[0].attrib['value']
+    price = _text(MC_PRICE(item)[0]).split()[0]
+    title = _text(MC_TITLE(item)[0])
+    description = _text(MC_DESCRIPTION(item)[0])
+
+    # Assumes that mcmaster only ever has 1 extra attribute
+    extra_attr = MC_EXTRA_ATTR(item)
+    extra_attr = _text(extra_attr[0]) if extra_attr else None
+    return McLine(part_number, quantity, extra_attr, title=title, description=description, price=price)
+
+def html_ms_lxml(input_content):
+    return CartBatch('MetalSupermarkets', (ms_item_lxml(item) for item in _cart_items(MS_CART_ITEMS, input_content)))
+
+def html_mc_lxml(input_content):
+    return CartBatch('McMaster', (mc_item_lxml(item) for item in _cart_items(MC_CART_ITEMS, input_content)))
+
+def is_ms_item(element):
+    return element.get('id', '').startswith('cartitem_')
+
+def is_mc_item(element):
+    return element.get('class') == 'order-pad-line'
+
+def iter_cart_items(vendor, source):
+    """Yield MsLine/McLine cart items from an HTML file or file object as the parser reaches them.
+
+    Everything outside an item is freed once parsed, and each item once extracted,
+    so memory stays flat however large the saved page is.
+    """
+    is_item, item_lxml = (is_ms_item, ms_item_lxml) if vendor == 'MetalSupermarkets' else (is_mc_item, mc_item_lxml)
+
+    open_items = 0
+    events = etree.iterparse(source, events=('start', 'end'), html=True, encoding='utf-8')
+    try:
+        first = next(events, None)
+    except etree.XMLSyntaxError:
+        # An empty file has no document to parse, and so no items
+        return
+    if first is None:
+        return
+    for event, element in itertools.chain((first,), events):
+        if event == 'start':
+            if is_item(element):
+                open_items += 1
+            continue
+
+        if is_item(element):
+            open_items -= 1
+            yield item_lxml(element)
+        elif open_items:
+            # Part of an item that hasn't been extracted yet
+            continue
+
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+def html_ms_bs4(input_content):
     html_content = input_content
 
     soup = bs4.BeautifulSoup(html_content, 'lxml')
     cart_items = soup.select('[id^="cartitem_"]')
-    output_cart = []
+    output_cart = CartBatch('MetalSupermarkets')
 
     for item in cart_items:
         output_item = []
         item_name = item.select_one('h3.product-name').string
         item_info = item.select_one('p.product-info').string
-        output_item.append(['pro_name', item_name])
-        output_item.append(['pro_info', item_info])
-        output_item.append(['pro_link', f'https://www.metalsupermarkets.com/product/{item_name.lower().replace(" ", "-")}'])
+        output_item.append(('pro_name', item_name))
+        output_item.append(('pro_info', item_info))
+        output_item.append(('pro_link', f'https://www.metalsupermarkets.com/product/{item_name.lower().replace(" ", "-")}'))
         item_inputs = item.select('input')
         for input in item_inputs:
             try:
-                output_item.append([input['name'], input['value']])
+                output_item.append((input['name'], input['value']))
             except:
-                output_item.append([input['class'][0], input['value']])
-        output_cart.append(output_item)
+                output_item.append((input['class'][0], input['value']))
+        output_cart.append(MsLine.from_pairs(output_item))
 
     return output_cart
 
-def html_mc(input_content):
+def html_mc_bs4(input_content):
     html_content = input_content
 
     soup = bs4.BeautifulSoup(html_content, 'lxml')
     cart_items = soup.select('[class="order-pad-line"]')
-    output_cart = []
+    output_cart = CartBatch('McMaster')
     for item in cart_items:
         # print(item)
         part_number = item.select_one('[id^="line-part-number-input"]')['value']
@@ -50,18 +284,12 @@ def html_mc(input_content):
         # Assumes that mcmaster only ever has 1 extra attribute
         extra_attr = item.select_one('[class="inline-spec-attribute-text-with-input"]')
         if(extra_attr): extra_attr = extra_attr.get_text()
-        output_cart.append([
-            ['title', title],
-            ['description', description],
-            ['part_number', part_number],
-            ['quantity', quantity],
-            ['price', price],
-            ['extra_attr', extra_attr]
-        ])
+        output_cart.append(McLine(part_number, quantity, extra_attr, title=title, description=description, price=price))
 
     return output_cart
 
 def array_to_csv(data, output_filename):
+    data = [item.to_pairs() for item in data]
     all_keys = set()
     for item in data:
         for kv in item:
@@ -77,156 +305,295 @@ def array_to_csv(data, output_filename):
             item_dict = {kv[0]: kv[1] for kv in item}
             writer.writerow(item_dict)
 
-def raw_to_array(raw_input):
-    header = ['ordered', 'approved', 'name', 'subteam', 'vendor', 'part_number', 'description', 'unit_price', 'quantity', 'dimensions', 'link']
-    mc = []
-    ms = []
+ORDER_HEADER = ['ordered', 'approved', 'name', 'subteam', 'vendor', 'part_number', 'description', 'unit_price', 'quantity', 'dimensions', 'link']
+CSV_HEADER = ['ordered', 'approved', 'vendor', 'part_number', 'description', 'unit_price', 'quantity', 'dimensions', 'link']
+CART_VENDORS = ('MetalSupermarkets', 'McMaster')
+
+# '<length>' or '<length> X <width>', the X in either case
+DIMENSION_SEPARATOR = re.compile(r'\s*[xX]\s*')
+DIMENSION = re.compile(r'\d+(\.\d*)?|\.\d+')
+
+def split_dimensions(dimensions):
+    return [dim.strip() for dim in DIMENSION_SEPARATOR.split(dimensions.strip())]
+
+def validate_row(item_dict):
+    """Problem with an order row for a cart vendor, or None if it can be carted"""
+    if not item_dict['part_number']:
+        return 'missing part number'
+    if not item_dict['quantity'].isdigit() or int(item_dict['quantity']) < 1:
+        return f"quantity must be a positive whole number, got '{item_dict['quantity']}'"
+    if item_dict['vendor'] == "MetalSupermarkets":
+        if not item_dict['link']:
+            return 'missing product link'
+        dims = split_dimensions(item_dict['dimensions'])
+        if len(dims) > 2 or not all(DIMENSION.fullmatch(dim) for dim in dims):
+            return f"dimensions must be '<length>' or '<length> X <width>', got '{item_dict['dimensions']}'"
+    return None
+
+def iter_order_rows(lines, header=ORDER_HEADER, errors=None, skipped=None):
+    """Yield (line_number, vendor, MsLine or McLine) for each cartable '||' row as it is read.
+
+    Invalid rows are appended to errors and rows for other vendors to skipped, both with their line number.
+    """
+    for line_number, input_str in enumerate(lines, start=1):
+        if not input_str.strip():
+            continue
 
-    for input_str in raw_input:
         item_list = input_str.split('||')
-        item = [[key, value] for key, value in zip(header, item_list)]
-
-        item_dict = {kv[0].strip(): kv[1].strip() for kv in item}
-
-        if(item_dict['vendor'] == "MetalSupermarkets"):
-            dims = item_dict['dimensions'].split('X')
-            ms_item = {
-                'pro_link': item_dict['link'],
-                'pro_sku': item_dict['part_number'],
-                'pro_length': dims[0].strip(),
-                'sel_quantity': item_dict['quantity']
-            }
-
-            if(len(dims) > 1):
-                ms_item['pro_width'] = dims[1]
-            ms.append(list(ms_item.items()))
-        
-        elif(item_dict['vendor'] == "McMaster"):
-            dims = item_dict['dimensions']
-            mc_item = {
-                'part_number': item_dict['part_number'],
-                'quantity': item_dict['quantity'],
-                'link': item_dict['link']
-            }
-
-            if(dims):
-                mc_item['extra_attr'] = dims.strip()
-
-            mc.append(list(mc_item.items()))
-
-    return (ms, mc)
-
-        
-def csv_to_array(input_filename):
-    header = ['ordered', 'approved', 'vendor', 'part_number', 'description', 'unit_price', 'quantity', 'dimensions', 'link']
+        if len(item_list) < len(header):
+            if errors is not None:
+                errors.append({'line': line_number, 'error': f'expected {len(header)} fields, got {len(item_list)}'})
+            continue
+
+        item_dict = {key: value.strip() for key, value in zip(header, item_list)}
+        vendor = item_dict['vendor']
+        if vendor not in CART_VENDORS:
+            if skipped is not None:
+                skipped.append({'line': line_number, 'vendor': vendor})
+            continue
+
+        problem = validate_row(item_dict)
+        if problem:
+            if errors is not None:
+                errors.append({'line': line_number, 'vendor': vendor, 'error': problem})
+            continue
+
+        if(vendor == "MetalSupermarkets"):
+            dims = split_dimensions(item_dict['dimensions'])
+            item = MsLine(
+                pro_sku=item_dict['part_number'],
+                sel_quantity=item_dict['quantity'],
+                pro_length=dims[0],
+                pro_width=dims[1] if len(dims) > 1 else None,
+                pro_link=item_dict['link'],
+                rows=(line_number,)
+            )
+        else:
+            item = McLine(
+                part_number=item_dict['part_number'],
+                quantity=item_dict['quantity'],
+                extra_attr=item_dict['dimensions'] or None,
+                link=item_dict['link'],
+                rows=(line_number,)
+            )
+
+        yield line_number, vendor, item
+
+def iter_file_lines(path):
+    """Lines of a spooled upload, deleting the file once they have been read"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip('\r\n')
+    finally:
+        os.remove(path)
+
+def rows_to_array(rows):
     mc = []
     ms = []
+    for _, vendor, item in rows:
+        if(vendor == "MetalSupermarkets"):
+            ms.append(item)
+        else:
+            mc.append(item)
+    return (CartBatch('MetalSupermarkets', ms), CartBatch('McMaster', mc))
+
+def raw_to_array(raw_input):
+    return rows_to_array(iter_order_rows(raw_input))
 
+def csv_to_array(input_filename):
     with(open(input_filename, 'r') as f):
-        items = f.readlines()
-
-        for item_str in items:
-            item_list = item_str.split('||')
-            item = [[key, value] for key, value in zip(header, item_list)]
-
-            item_dict = {kv[0].strip(): kv[1].strip() for kv in item}
-
-            if(item_dict['vendor'] == "MetalSupermarkets"):
-                dims = item_dict['dimensions'].split('X')
-                ms_item = {
-                    'pro_link': item_dict['link'],
-                    'pro_sku': item_dict['part_number'],
-                    'pro_length': dims[0].strip(),
-                    'sel_quantity': item_dict['quantity']
-                }
-
-                if(len(dims) > 1):
-                    ms_item['pro_width'] = dims[1]
-                ms.append(list(ms_item.items()))
-            
-            elif(item_dict['vendor'] == "McMaster"):
-                dims = item_dict['dimensions']
-                mc_item = {
-                    'part_number': item_dict['part_number'],
-                    'quantity': item_dict['quantity'],
-                    'link': item_dict['link']
-                }
-
-                if(dims):
-                    mc_item['extra_attr'] = dims.strip()
-
-                mc.append(list(mc_item.items()))
-
-    return (ms, mc)
+        return rows_to_array(iter_order_rows(f, CSV_HEADER))
 
 def send_request(link):
+    start = time.perf_counter()
     try:
-        requests.get(link, timeout=10)
+        response = submit_session.get(link, timeout=SUBMIT_TIMEOUT)
+        response.raise_for_status()
         print("Submitted part request")
+        latency = time.perf_counter() - start
+        metrics.submit_seconds.observe(latency, outcome='ok')
+        return {'ok': True, 'status': response.status_code, 'error': None, 'latency': latency}
     except requests.RequestException as e:
         print(f'Failed to send request, error: {e}')
+        status = e.response.status_code if e.response is not None else None
+        latency = time.perf_counter() - start
+        metrics.submit_seconds.observe(latency, outcome='failed')
+        metrics.failures.inc(cause=f'submit_http_{status}' if status else 'submit_connection')
+        return {'ok': False, 'status': status, 'error': str(e), 'latency': latency}
+
 
+def _or(value, default):
+    return default if value is None else value
 
 def create_vendor_part(vendor, item):
     if(vendor == "MetalSupermarkets"):
-        dimensions = item.get('pro_length', -1)
-        if(item.get('pro_width')):
-            dimensions = f'{item.get("pro_length")} X {item.get("pro_width")}'
+        dimensions = _or(item.pro_length, -1)
+        if(item.pro_width):
+            dimensions = f'{item.pro_length} X {item.pro_width}'
 
-        link = f'https://www.metalsupermarkets.com/product/{item.get('pro_name').lower().replace(" ", "-")}'
+        link = f'https://www.metalsupermarkets.com/product/{item.pro_name.lower().replace(" ", "-")}'
 
         return {
             'vendor': 'MetalSupermarkets',
-            'part_number': item.get('pro_sku', 'N/A'),
-            'description': f'{item.get('pro_name', 'N/A')}, {item.get('pro_info')}',
-            'unit_price': item.get('price_value', -1),
-            'quantity': item.get('sel_quantity', -1),
+            'part_number': _or(item.pro_sku, 'N/A'),
+            'description': f'{_or(item.pro_name, "N/A")}, {item.pro_info}',
+            'unit_price': (item.extra or {}).get('price_value', -1),
+            'quantity': _or(item.sel_quantity, -1),
             'dimensions': dimensions,
             'url': link
         }
     if(vendor == "McMaster"):        
         return {
             'vendor': 'McMaster',
-            'part_number': item.get('part_number', 'N/A'),
-            'description': f'{item.get("title", "N/A")}, {item.get("description", "N/A")}',
-            'unit_price': item.get('price', -1),
-            'quantity': item.get('quantity', ''),
-            'dimensions': item.get('extra_attr', ''),
-            'url': f'https://mcmaster.com/{item.get('part_number', '')}'
+            'part_number': item.part_number,
+            'description': f'{_or(item.title, "N/A")}, {_or(item.description, "N/A")}',
+            'unit_price': _or(item.price, -1),
+            'quantity': item.quantity,
+            'dimensions': item.extra_attr,
+            'url': f'https://mcmaster.com/{item.part_number}'
         }
 
 
-def submit(vendor, data, name, subteam):
+def skipped_request():
+    return {'ok': True, 'skipped': True, 'status': None, 'error': None, 'latency': 0.0}
+
+def submit(vendor, data, name, subteam, progress=no_progress, extraction=None):
     form_link_template = os.getenv('SUBMIT_FORM_LINK')
     
     request_list = []
+    part_numbers = []
     for item in data:
-        item_dict = {kv[0]: kv[1] for kv in item}
-        part_dict = create_vendor_part(vendor, item_dict)
+        part_dict = create_vendor_part(vendor, item)
         part_dict['name'] = name
         part_dict['subteam'] = subteam
-        logging.warning('test!')
-        logging.warning(part_dict)
+        logging.debug(part_dict)
         form_link_filled = form_link_template.format_map(part_dict)
         # print(name, subteam)
         # form_link_filled = form_link_filled.format(name=name, subteam=subteam)
         print(form_link_filled)
         request_list.append(form_link_filled)
+        part_numbers.append(part_dict['part_number'])
+
+    # Positions are part of the key so identical lines in one cart are each still sent once
+    keys = list(enumerate(request_list))
+    to_send = extraction.claim(keys) if extraction else set(keys)
+
+    def send(key):
+        return send_request(key[1]) if key in to_send else skipped_request()
+
+    parts = []
+    failed_keys = []
+    for part_number, key, result in zip(part_numbers, keys, submit_executor.map(send, keys)):
+        result['part_number'] = part_number
+        result['latency'] = round(result['latency'], 3)
+        parts.append(result)
+        if not result['ok']:
+            failed_keys.append(key)
+        progress('part_submitted', part_number=part_number, ok=result['ok'], skipped=result.get('skipped', False))
+
+    # Let a retried upload send these again
+    if extraction:
+        extraction.release(failed_keys)
+
+    failed = len(failed_keys)
+    skipped = sum(1 for part in parts if part.get('skipped'))
+    print(f'All {len(data)} parts have been submitted, {failed} failed, {skipped} already sent')
+    return {'submitted': len(parts) - failed - skipped, 'failed': failed, 'skipped': skipped, 'parts': parts}
+
+class SpooledUpload:
+    """An uploaded cart page copied to a temp file, keyed by its content as it was copied"""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+
+    @classmethod
+    def from_stream(cls, vendor, stream, chunk_size=64 * 1024):
+        digest = hashlib.sha256()
+        fd, path = tempfile.mkstemp(prefix='cart-', suffix='.html')
+        with os.fdopen(fd, 'wb') as spool:
+            while chunk := stream.read(chunk_size):
+                digest.update(chunk)
+                spool.write(chunk)
+        # Same key content_key would give the bytes
+        return cls(path, f'{vendor}:{digest.hexdigest()}')
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def parse_cart(vendor, input_content):
+    """Cart items in an uploaded page, given as str, bytes or a SpooledUpload. Runs in the parse pool when there is one"""
+    if isinstance(input_content, SpooledUpload):
+        if EXTRACT_PARSER != 'bs4':
+            return CartBatch(vendor, iter_cart_items(vendor, input_content.path))
+        input_content = input_content.read()
+    parse = html_ms if vendor == 'MetalSupermarkets' else html_mc
+    return parse(input_content)
+
+def parse_upload(vendor, input_content):
+    if parse_pool is not None:
+        try:
+            return parse_pool.submit(parse_cart, vendor, input_content).result()
+        except BrokenProcessPool:
+            metrics.failures.inc(cause='parse_pool_broken')
+            print('-> Parse pool is broken, parsing in this process')
+    return parse_cart(vendor, input_content)
+
+def extract_cart(vendor, input_content, name, subteam, progress=no_progress):
+    """Parse an uploaded cart (reusing an earlier parse of the same upload) and submit its parts.
+
+    A SpooledUpload's file is removed as soon as it has been parsed.
+    """
+    spooled = isinstance(input_content, SpooledUpload)
+    key = input_content.key if spooled else content_key(vendor, input_content)
+    store = jobstore.get_store()
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        executor.map(send_request, request_list)
-    
-    print(f'All {len(data)} parts have been submitted')
+    try:
+        columns = store.extraction(key)
+        cached = columns is not None
+        if cached:
+            data = CartBatch.from_columns(vendor, columns)
+        else:
+            with metrics.parse_seconds.time(vendor=vendor):
+                data = parse_upload(vendor, input_content)
+            store.save_extraction(key, data.to_columns())
+    finally:
+        if spooled:
+            input_content.remove()
+
+    progress('parsed', vendor=vendor, parts=len(data), cached=cached)
+    submissions = submit(vendor, data, name, subteam, progress, CartExtraction(key, data, store))
+    return data, submissions
+
+def warm_parsers():
+    """Parse an empty page for each vendor so the first upload doesn't set up the parser"""
+    for vendor in ('MetalSupermarkets', 'McMaster'):
+        parse_cart(vendor, b'<html><body></body></html>')
+
+def warm_http_pool():
+    """Open a kept-alive connection to the form host ahead of the first submission"""
+    form_link = os.getenv('SUBMIT_FORM_LINK')
+    if not form_link:
+        return
+    url = urlsplit(form_link)
+    try:
+        submit_session.head(f'{url.scheme}://{url.netloc}/', timeout=SUBMIT_TIMEOUT)
+    except requests.RequestException as e:
+        print(f'-> Failed to warm the form connection: {e}')
 
-def metal_supermarkets(input_content, name, subteam):
-    data = html_ms(input_content)
-    submit('MetalSupermarkets', data, name, subteam)
-    return data
+def metal_supermarkets(input_content, name, subteam, progress=no_progress):
+    return extract_cart('MetalSupermarkets', input_content, name, subteam, progress)
 
-def mcmaster(input_content, name, subteam):
-    data = html_mc(input_content)
-    submit('McMaster', data, name, subteam)
-    return data
+def mcmaster(input_content, name, subteam, progress=no_progress):
+    return extract_cart('McMaster', input_content, name, subteam, progress)
 
 # def metal_supermarkets(html_filepath, input_content=None):
 #     data = html_ms(html_filepath, input_content)
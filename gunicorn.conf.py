@@ -0,0 +1,26 @@
+import os
+
+# Workers start their parse pool and scheduler in post_worker_init rather than at import
+os.environ['DEFER_STARTUP'] = '1'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# In local mode every worker runs its own scheduler and browsers, so keep this at 1 unless using rq
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+# Threads so SSE streams and long-polls don't hold up uploads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+# Import the app, Selenium and the parsers once in the master; workers fork with them loaded
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    if server.cfg.preload_app:
+        import main
+        main.preload()
+        print(f"-> Preloaded app: {main.startup_seconds}")
+
+
+def post_worker_init(worker):
+    import main
+    main.after_fork()
+    print(f"-> [worker {worker.pid}] Ready: {main.startup_seconds}")
@@ -0,0 +1,857 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+WORKER_MODE = os.getenv('WORKER_MODE', 'local')
+# Workers on other machines can only report back through a shared store
+JOB_STORE = os.getenv('JOB_STORE', 'redis' if WORKER_MODE == 'rq' else 'sqlite')
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'jobs.db')
+# Order sheet lines written or read per round trip
+SHEET_PAGE_SIZE = 500
+# Finished jobs older than this many seconds are evicted
+JOB_TTL = int(os.getenv('JOB_TTL', 24 * 60 * 60))
+JOB_MAX_COUNT = int(os.getenv('JOB_MAX_COUNT', 1000))
+# A pending or processing job untouched this long was orphaned by a process that died, and can be resumed
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 60 * 60))
+# A request holding an Idempotency-Key this long is taken to have died, and a retry may take the key over
+KEY_LEASE_SECONDS = 60
+EVICT_INTERVAL = 60
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Small fields kept with the job; everything else (result, submissions, ...) is stored separately
+META_FIELDS = ('id', 'type', 'status', 'created_at', 'updated_at', 'error')
+FINISHED = ('completed', 'failed')
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def _cutoff(ttl):
+    return (datetime.now() - timedelta(seconds=ttl)).isoformat()
+
+
+def resumable(job, stale_after=JOB_STALE_SECONDS):
+    """Whether a job can be resumed: finished, or left pending or processing for longer than stale_after"""
+    return job['status'] in FINISHED or job['updated_at'] < _cutoff(stale_after)
+
+
+def _status_event(status, error):
+    event = {'type': 'status', 'status': status}
+    if error:
+        event['error'] = error
+    return event
+
+
+def _pages(values, size=SHEET_PAGE_SIZE):
+    page = []
+    for value in values:
+        page.append(value)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _poll_events(store, job_id, since, timeout, interval=0.25):
+    """wait_events for stores that can't be notified across processes"""
+    deadline = time.monotonic() + timeout
+    while True:
+        events = store.events(job_id, since)
+        if events or time.monotonic() >= deadline:
+            return events
+        time.sleep(interval)
+
+
+class MemoryJobStore:
+    """Jobs in a dict, for a single process"""
+
+    def __init__(self, ttl=JOB_TTL, max_count=JOB_MAX_COUNT, stale_after=JOB_STALE_SECONDS, key_lease=KEY_LEASE_SECONDS):
+        self.ttl = ttl
+        self.max_count = max_count
+        self.stale_after = stale_after
+        self.key_lease = key_lease
+        self._jobs = OrderedDict()
+        self._payloads = {}
+        self._sheets = {}
+        self._items = {}
+        self._by_status = {}
+        self._by_type = {}
+        self._events = {}
+        self._keys = {}
+        self._extractions = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _index(self, index, key, job_id, add=True):
+        ids = index.setdefault(key, set())
+        if add:
+            ids.add(job_id)
+        else:
+            ids.discard(job_id)
+
+    def create(self, job_type, status='pending'):
+        job_id = str(uuid.uuid4())
+        now = _now()
+        with self._lock:
+            self._jobs[job_id] = {
+                'id': job_id,
+                'type': job_type,
+                'status': status,
+                'created_at': now,
+                'updated_at': now,
+                'error': None,
+            }
+            self._payloads[job_id] = {'result': None}
+            self._events[job_id] = []
+            self._index(self._by_status, status, job_id)
+            self._index(self._by_type, job_type, job_id)
+            self._evict()
+        return job_id
+
+    def update(self, job_id, status=None, result=None, error=None, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if status:
+                self._index(self._by_status, job['status'], job_id, add=False)
+                self._index(self._by_status, status, job_id)
+                job['status'] = status
+            if error:
+                job['error'] = error
+            job['updated_at'] = _now()
+            if result:
+                self._payloads[job_id]['result'] = result
+            self._payloads[job_id].update(fields)
+            if status:
+                self._append(job_id, _status_event(status, error))
+
+    def resume(self, job_id):
+        """Move a finished or orphaned job back to pending with its error cleared and 'resumes' counted.
+
+        Returns False, changing nothing, unless the job was resumable, so of two concurrent resumes only one wins.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not resumable(job, self.stale_after):
+                return False
+            self._index(self._by_status, job['status'], job_id, add=False)
+            self._index(self._by_status, 'pending', job_id)
+            job.update(status='pending', error=None, updated_at=_now())
+            payload = self._payloads[job_id]
+            payload['resumes'] = payload.get('resumes', 0) + 1
+            self._append(job_id, _status_event('pending', None))
+            return True
+
+    def save_sheet(self, job_id, lines):
+        """Store the job's order sheet, one entry per line, so it can be resumed"""
+        lines = list(lines)
+        with self._lock:
+            if job_id in self._jobs:
+                self._sheets[job_id] = lines
+
+    def sheet(self, job_id):
+        """The job's stored order sheet lines, in order"""
+        with self._lock:
+            return iter(list(self._sheets.get(job_id, ())))
+
+    def checkpoint(self, job_id, items):
+        """Record per-item outcomes {key: fields} on the job, replacing earlier ones for the same keys"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._items.setdefault(job_id, {}).update(items)
+                self._jobs[job_id]['updated_at'] = _now()
+
+    def _append(self, job_id, event):
+        events = self._events[job_id]
+        events.append({'seq': len(events) + 1, 'at': _now(), **event})
+        self._changed.notify_all()
+
+    def append_event(self, job_id, event):
+        with self._lock:
+            if job_id in self._events:
+                self._append(job_id, event)
+
+    def events(self, job_id, since=0):
+        with self._lock:
+            return list(self._events.get(job_id, ())[since:])
+
+    def wait_events(self, job_id, since=0, timeout=25):
+        """Events after since, blocking up to timeout seconds for the first one"""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._events.get(job_id, ())) > since, timeout)
+            return list(self._events.get(job_id, ())[since:])
+
+    def get(self, job_id):
+        with self._lock:
+            if job_id not in self._jobs:
+                return None
+            job = {**self._jobs[job_id], **self._payloads[job_id]}
+            if job_id in self._items:
+                job['items'] = dict(self._items[job_id])
+            return job
+
+    def list(self, status=None, job_type=None, limit=50, offset=0):
+        with self._lock:
+            ids = None
+            if status:
+                ids = set(self._by_status.get(status, ()))
+            if job_type:
+                type_ids = self._by_type.get(job_type, set())
+                ids = type_ids if ids is None else ids & type_ids
+
+            jobs = []
+            for job_id in reversed(self._jobs):
+                if ids is not None and job_id not in ids:
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                if len(jobs) >= limit:
+                    break
+                jobs.append(dict(self._jobs[job_id]))
+            return jobs
+
+    def reserve_key(self, key):
+        """Hold an Idempotency-Key for one request. False if another request holds it or has saved its response"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None and (entry['response'] is not None or entry['at'] >= _cutoff(self.key_lease)):
+                return False
+            self._keys[key] = {'response': None, 'at': _now()}
+            return True
+
+    def key_response(self, key):
+        """The response saved for an Idempotency-Key, or None if there is none yet"""
+        with self._lock:
+            entry = self._keys.get(key)
+            return entry['response'] if entry else None
+
+    def save_key_response(self, key, response):
+        with self._lock:
+            self._keys[key] = {'response': response, 'at': _now()}
+
+    def release_key(self, key):
+        """Give up a held key without a response, so a retry runs again"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None and entry['response'] is None:
+                del self._keys[key]
+
+    def save_extraction(self, key, data):
+        """Keep an uploaded cart's parse result, keyed by its content, for re-uploads"""
+        with self._lock:
+            entry = self._extractions.setdefault(key, {'data': None, 'sent': set()})
+            entry.update(data=data, at=_now())
+
+    def extraction(self, key):
+        with self._lock:
+            entry = self._extractions.get(key)
+            return entry['data'] if entry else None
+
+    def claim_parts(self, key, parts):
+        """Mark an upload's form requests as sent, returning only those that weren't already"""
+        with self._lock:
+            entry = self._extractions.setdefault(key, {'data': None, 'sent': set(), 'at': _now()})
+            claimed = set(parts) - entry['sent']
+            entry['sent'] |= claimed
+            return claimed
+
+    def release_parts(self, key, parts):
+        """Unmark requests that failed, so a retried upload sends them again"""
+        with self._lock:
+            if key in self._extractions:
+                self._extractions[key]['sent'].difference_update(parts)
+
+    def _drop(self, job_id):
+        job = self._jobs.pop(job_id)
+        self._payloads.pop(job_id, None)
+        self._sheets.pop(job_id, None)
+        self._items.pop(job_id, None)
+        self._events.pop(job_id, None)
+        self._index(self._by_status, job['status'], job_id, add=False)
+        self._index(self._by_type, job['type'], job_id, add=False)
+
+    def _evict(self):
+        cutoff = _cutoff(self.ttl)
+        for cache in (self._keys, self._extractions):
+            for key, entry in list(cache.items()):
+                if entry['at'] < cutoff:
+                    del cache[key]
+
+        for job_id, job in list(self._jobs.items()):
+            if job['created_at'] >= cutoff:
+                break
+            if job['status'] in FINISHED:
+                self._drop(job_id)
+
+        # Over max_count, drop the finished ones among the oldest; a pending or running job is never evicted
+        excess = len(self._jobs) - self.max_count
+        if excess > 0:
+            for job_id in list(self._jobs)[:excess]:
+                if self._jobs[job_id]['status'] in FINISHED:
+                    self._drop(job_id)
+
+
+class SqliteJobStore:
+    """Jobs in a SQLite file, shared by every worker process on the machine"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+        CREATE INDEX IF NOT EXISTS jobs_type ON jobs (type, created_at);
+        CREATE TABLE IF NOT EXISTS job_payloads (
+            id TEXT PRIMARY KEY REFERENCES jobs (id) ON DELETE CASCADE,
+            payload TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS job_events (
+            id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            PRIMARY KEY (id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS job_sheet_lines (
+            id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+            line INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (id, line)
+        );
+        CREATE TABLE IF NOT EXISTS job_items (
+            id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+            key TEXT NOT NULL,
+            item TEXT NOT NULL,
+            PRIMARY KEY (id, key)
+        );
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            response TEXT,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS extractions (
+            key TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS extraction_sent (
+            key TEXT NOT NULL,
+            part TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (key, part)
+        );
+    '''
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_TTL, max_count=JOB_MAX_COUNT, stale_after=JOB_STALE_SECONDS,
+                 key_lease=KEY_LEASE_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.max_count = max_count
+        self.stale_after = stale_after
+        self.key_lease = key_lease
+        self._local = threading.local()
+        self._last_evict = 0
+        # Use a throwaway connection so none is inherited across a fork
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executescript(self.SCHEMA)
+        conn.close()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def create(self, job_type, status='pending'):
+        job_id = str(uuid.uuid4())
+        now = _now()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, type, status, created_at, updated_at, error) VALUES (?, ?, ?, ?, ?, NULL)',
+                (job_id, job_type, status, now, now)
+            )
+            conn.execute('INSERT INTO job_payloads (id, payload) VALUES (?, ?)', (job_id, '{"result": null}'))
+
+        if time.monotonic() - self._last_evict > EVICT_INTERVAL:
+            self._last_evict = time.monotonic()
+            self.evict()
+        return job_id
+
+    def update(self, job_id, status=None, result=None, error=None, **fields):
+        with self._transaction() as conn:
+            updated = conn.execute(
+                'UPDATE jobs SET status = COALESCE(?, status), error = COALESCE(?, error), updated_at = ? WHERE id = ?',
+                (status or None, error or None, _now(), job_id)
+            ).rowcount
+            # Evicted, like the other stores this is then a no-op
+            if not updated:
+                return
+            if result or fields:
+                row = conn.execute('SELECT payload FROM job_payloads WHERE id = ?', (job_id,)).fetchone()
+                if row is not None:
+                    payload = json.loads(row['payload'])
+                    if result:
+                        payload['result'] = result
+                    payload.update(fields)
+                    conn.execute('UPDATE job_payloads SET payload = ? WHERE id = ?', (json.dumps(payload), job_id))
+            if status:
+                self._append(conn, job_id, _status_event(status, error))
+
+    def resume(self, job_id):
+        with self._transaction() as conn:
+            claimed = conn.execute(
+                f'''UPDATE jobs SET status = ?, error = NULL, updated_at = ?
+                    WHERE id = ? AND (status IN ({", ".join("?" for _ in FINISHED)}) OR updated_at < ?)''',
+                ('pending', _now(), job_id, *FINISHED, _cutoff(self.stale_after))
+            ).rowcount
+            if not claimed:
+                return False
+            row = conn.execute('SELECT payload FROM job_payloads WHERE id = ?', (job_id,)).fetchone()
+            payload = json.loads(row['payload'])
+            payload['resumes'] = payload.get('resumes', 0) + 1
+            conn.execute('UPDATE job_payloads SET payload = ? WHERE id = ?', (json.dumps(payload), job_id))
+            self._append(conn, job_id, _status_event('pending', None))
+            return True
+
+    def save_sheet(self, job_id, lines):
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO job_sheet_lines (id, line, text) VALUES (?, ?, ?)',
+                ((job_id, number, text) for number, text in enumerate(lines, start=1))
+            )
+
+    def sheet(self, job_id):
+        # A page at a time, so a long carting job doesn't hold a read open
+        last = 0
+        while True:
+            rows = self._conn().execute(
+                'SELECT line, text FROM job_sheet_lines WHERE id = ? AND line > ? ORDER BY line LIMIT ?',
+                (job_id, last, SHEET_PAGE_SIZE)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row['text']
+            last = rows[-1]['line']
+
+    def checkpoint(self, job_id, items):
+        # One row per item, so a checkpoint costs the same however many came before it
+        with self._transaction() as conn:
+            if conn.execute('UPDATE jobs SET updated_at = ? WHERE id = ?', (_now(), job_id)).rowcount == 0:
+                return
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_items (id, key, item) VALUES (?, ?, ?)',
+                [(job_id, key, json.dumps(item)) for key, item in items.items()]
+            )
+
+    def _append(self, conn, job_id, event):
+        conn.execute(
+            '''INSERT INTO job_events (id, seq, event)
+               SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE id = ?''',
+            (job_id, json.dumps({'at': _now(), **event}), job_id)
+        )
+
+    def append_event(self, job_id, event):
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone() is not None:
+                self._append(conn, job_id, event)
+
+    def events(self, job_id, since=0):
+        rows = self._conn().execute(
+            'SELECT seq, event FROM job_events WHERE id = ? AND seq > ? ORDER BY seq',
+            (job_id, since)
+        ).fetchall()
+        return [{'seq': row['seq'], **json.loads(row['event'])} for row in rows]
+
+    def wait_events(self, job_id, since=0, timeout=25):
+        return _poll_events(self, job_id, since, timeout)
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            'SELECT jobs.*, job_payloads.payload FROM jobs LEFT JOIN job_payloads USING (id) WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = {field: row[field] for field in META_FIELDS}
+        job.update(json.loads(row['payload'] or '{}'))
+        items = self._conn().execute('SELECT key, item FROM job_items WHERE id = ?', (job_id,)).fetchall()
+        if items:
+            job['items'] = {item['key']: json.loads(item['item']) for item in items}
+        return job
+
+    def list(self, status=None, job_type=None, limit=50, offset=0):
+        clauses, params = [], []
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if job_type:
+            clauses.append('type = ?')
+            params.append(job_type)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT {", ".join(META_FIELDS)} FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+            (*params, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def reserve_key(self, key):
+        with self._transaction() as conn:
+            if conn.execute(
+                'INSERT OR IGNORE INTO idempotency_keys (key, response, created_at) VALUES (?, NULL, ?)', (key, _now())
+            ).rowcount:
+                return True
+            # Taken over from a request that held it past its lease without saving a response
+            return conn.execute(
+                'UPDATE idempotency_keys SET created_at = ? WHERE key = ? AND response IS NULL AND created_at < ?',
+                (_now(), key, _cutoff(self.key_lease))
+            ).rowcount == 1
+
+    def key_response(self, key):
+        row = self._conn().execute('SELECT response FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['response']) if row and row['response'] is not None else None
+
+    def save_key_response(self, key, response):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO idempotency_keys (key, response, created_at) VALUES (?, ?, ?)',
+            (key, json.dumps(response), _now())
+        )
+
+    def release_key(self, key):
+        self._conn().execute('DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL', (key,))
+
+    def save_extraction(self, key, data):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO extractions (key, data, created_at) VALUES (?, ?, ?)',
+            (key, json.dumps(data), _now())
+        )
+
+    def extraction(self, key):
+        row = self._conn().execute('SELECT data FROM extractions WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def claim_parts(self, key, parts):
+        now = _now()
+        with self._transaction() as conn:
+            return {
+                part for part in parts
+                if conn.execute('INSERT OR IGNORE INTO extraction_sent (key, part, created_at) VALUES (?, ?, ?)', (key, part, now)).rowcount
+            }
+
+    def release_parts(self, key, parts):
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM extraction_sent WHERE key = ? AND part = ?', ((key, part) for part in parts))
+
+    def evict(self):
+        with self._transaction() as conn:
+            for table in ('idempotency_keys', 'extractions', 'extraction_sent'):
+                conn.execute(f'DELETE FROM {table} WHERE created_at < ?', (_cutoff(self.ttl),))
+            conn.execute(
+                f'DELETE FROM jobs WHERE created_at < ? AND status IN ({", ".join("?" for _ in FINISHED)})',
+                (_cutoff(self.ttl), *FINISHED)
+            )
+            conn.execute(
+                f'''DELETE FROM jobs WHERE status IN ({", ".join("?" for _ in FINISHED)})
+                   AND id NOT IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)''',
+                (*FINISHED, self.max_count)
+            )
+
+
+_fake_redis_server = None
+
+
+def get_redis(decode_responses=False):
+    """Redis connection for REDIS_URL; 'fakeredis://' gives an in-process stand-in for local runs"""
+    global _fake_redis_server
+    if REDIS_URL.startswith('fakeredis://'):
+        import fakeredis
+        if _fake_redis_server is None:
+            _fake_redis_server = fakeredis.FakeServer()
+        return fakeredis.FakeRedis(server=_fake_redis_server, decode_responses=decode_responses)
+
+    import redis
+    return redis.Redis.from_url(REDIS_URL, decode_responses=decode_responses)
+
+
+class RedisJobStore:
+    """Jobs in Redis, shared by the web process and rq workers on any machine"""
+
+    def __init__(self, conn=None, ttl=JOB_TTL, max_count=JOB_MAX_COUNT, stale_after=JOB_STALE_SECONDS,
+                 key_lease=KEY_LEASE_SECONDS):
+        self.conn = conn or get_redis(decode_responses=True)
+        self.ttl = ttl
+        self.max_count = max_count
+        self.stale_after = stale_after
+        self.key_lease = key_lease
+        self._last_evict = 0
+
+    def _key(self, job_id, part='meta'):
+        return f'job:{job_id}:{part}'
+
+    def create(self, job_type, status='pending'):
+        job_id = str(uuid.uuid4())
+        now = _now()
+        score = time.time()
+        pipe = self.conn.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            'id': job_id,
+            'type': job_type,
+            'status': status,
+            'created_at': now,
+            'updated_at': now,
+            'error': '',
+        })
+        pipe.set(self._key(job_id, 'payload'), '{"result": null}')
+        pipe.zadd('jobs:created', {job_id: score})
+        pipe.zadd(f'jobs:status:{status}', {job_id: score})
+        pipe.zadd(f'jobs:type:{job_type}', {job_id: score})
+        pipe.execute()
+
+        if time.monotonic() - self._last_evict > EVICT_INTERVAL:
+            self._last_evict = time.monotonic()
+            self.evict()
+        return job_id
+
+    def update(self, job_id, status=None, result=None, error=None, **fields):
+        meta_key = self._key(job_id)
+        payload_key = self._key(job_id, 'payload')
+
+        def _update(pipe):
+            job = pipe.hmget(meta_key, 'status', 'created_at')
+            payload = pipe.get(payload_key)
+            if job[0] is None:
+                return
+            score = pipe.zscore('jobs:created', job_id) or time.time()
+
+            pipe.multi()
+            changes = {'updated_at': _now()}
+            if status:
+                changes['status'] = status
+                pipe.zrem(f'jobs:status:{job[0]}', job_id)
+                pipe.zadd(f'jobs:status:{status}', {job_id: score})
+            if error:
+                changes['error'] = error
+            pipe.hset(meta_key, mapping=changes)
+            if (result or fields) and payload is not None:
+                payload = json.loads(payload)
+                if result:
+                    payload['result'] = result
+                payload.update(fields)
+                pipe.set(payload_key, json.dumps(payload))
+
+        self.conn.transaction(_update, meta_key, payload_key)
+        if status:
+            self.append_event(job_id, _status_event(status, error))
+
+    def resume(self, job_id):
+        meta_key = self._key(job_id)
+        payload_key = self._key(job_id, 'payload')
+        claimed = False
+
+        def _resume(pipe):
+            nonlocal claimed
+            status, updated_at = pipe.hmget(meta_key, 'status', 'updated_at')
+            payload = pipe.get(payload_key)
+            claimed = status is not None and resumable({'status': status, 'updated_at': updated_at}, self.stale_after)
+            if not claimed:
+                return
+            score = pipe.zscore('jobs:created', job_id) or time.time()
+            payload = json.loads(payload or '{}')
+            payload['resumes'] = payload.get('resumes', 0) + 1
+
+            pipe.multi()
+            pipe.hset(meta_key, mapping={'status': 'pending', 'error': '', 'updated_at': _now()})
+            pipe.zrem(f'jobs:status:{status}', job_id)
+            pipe.zadd('jobs:status:pending', {job_id: score})
+            pipe.set(payload_key, json.dumps(payload))
+
+        # WATCH makes a concurrent resume's transaction fail and rerun _resume, which then sees 'pending'
+        self.conn.transaction(_resume, meta_key, payload_key)
+        if claimed:
+            self.append_event(job_id, _status_event('pending', None))
+        return claimed
+
+    def save_sheet(self, job_id, lines):
+        sheet_key = self._key(job_id, 'sheet')
+        for page in _pages(lines):
+            self.conn.rpush(sheet_key, *page)
+
+    def sheet(self, job_id):
+        sheet_key = self._key(job_id, 'sheet')
+        start = 0
+        while True:
+            page = self.conn.lrange(sheet_key, start, start + SHEET_PAGE_SIZE - 1)
+            yield from page
+            if len(page) < SHEET_PAGE_SIZE:
+                return
+            start += SHEET_PAGE_SIZE
+
+    def checkpoint(self, job_id, items):
+        # Hash fields per item, so a checkpoint doesn't rewrite the ones before it
+        if not self.conn.exists(self._key(job_id)):
+            return
+        pipe = self.conn.pipeline()
+        pipe.hset(self._key(job_id, 'items'), mapping={key: json.dumps(item) for key, item in items.items()})
+        pipe.hset(self._key(job_id), 'updated_at', _now())
+        pipe.execute()
+
+    def append_event(self, job_id, event):
+        # An evicted job's events would otherwise be left behind with nothing to expire them
+        if self.conn.exists(self._key(job_id)):
+            self.conn.rpush(self._key(job_id, 'events'), json.dumps({'at': _now(), **event}))
+
+    def events(self, job_id, since=0):
+        events = self.conn.lrange(self._key(job_id, 'events'), since, -1)
+        return [{'seq': since + i + 1, **json.loads(event)} for i, event in enumerate(events)]
+
+    def wait_events(self, job_id, since=0, timeout=25):
+        return _poll_events(self, job_id, since, timeout)
+
+    def get(self, job_id):
+        pipe = self.conn.pipeline()
+        pipe.hgetall(self._key(job_id))
+        pipe.get(self._key(job_id, 'payload'))
+        pipe.hgetall(self._key(job_id, 'items'))
+        meta, payload, items = pipe.execute()
+        if not meta:
+            return None
+        job = {field: meta.get(field) or None for field in META_FIELDS}
+        job.update(json.loads(payload or '{}'))
+        if items:
+            job['items'] = {key: json.loads(item) for key, item in items.items()}
+        return job
+
+    def list(self, status=None, job_type=None, limit=50, offset=0):
+        if status and job_type:
+            index = f'jobs:tmp:{uuid.uuid4()}'
+            pipe = self.conn.pipeline()
+            pipe.zinterstore(index, [f'jobs:status:{status}', f'jobs:type:{job_type}'], aggregate='MAX')
+            pipe.zrevrange(index, offset, offset + limit - 1)
+            pipe.delete(index)
+            job_ids = pipe.execute()[1]
+        else:
+            index = f'jobs:status:{status}' if status else f'jobs:type:{job_type}' if job_type else 'jobs:created'
+            job_ids = self.conn.zrevrange(index, offset, offset + limit - 1)
+
+        pipe = self.conn.pipeline()
+        for job_id in job_ids:
+            pipe.hmget(self._key(job_id), *META_FIELDS)
+        return [
+            {field: value or None for field, value in zip(META_FIELDS, values)}
+            for values in pipe.execute() if values[0]
+        ]
+
+    def reserve_key(self, key):
+        # Held as an empty value that expires with the lease, so a request that died frees it
+        return bool(self.conn.set(f'idempotency:{key}', '', nx=True, px=int(self.key_lease * 1000)))
+
+    def key_response(self, key):
+        response = self.conn.get(f'idempotency:{key}')
+        return json.loads(response) if response else None
+
+    def save_key_response(self, key, response):
+        self.conn.set(f'idempotency:{key}', json.dumps(response), ex=self.ttl)
+
+    def release_key(self, key):
+        redis_key = f'idempotency:{key}'
+
+        def _release(pipe):
+            if pipe.get(redis_key) == '':
+                pipe.multi()
+                pipe.delete(redis_key)
+
+        self.conn.transaction(_release, redis_key)
+
+    def save_extraction(self, key, data):
+        self.conn.set(f'extraction:{key}', json.dumps(data), ex=self.ttl)
+
+    def extraction(self, key):
+        data = self.conn.get(f'extraction:{key}')
+        return json.loads(data) if data else None
+
+    def claim_parts(self, key, parts):
+        # SADD answers per part whether it was new, so of two concurrent claims only one gets each part
+        sent_key = f'extraction:{key}:sent'
+        parts = list(parts)
+        pipe = self.conn.pipeline()
+        for part in parts:
+            pipe.sadd(sent_key, part)
+        pipe.expire(sent_key, self.ttl)
+        added = pipe.execute()
+        return {part for part, new in zip(parts, added) if new}
+
+    def release_parts(self, key, parts):
+        parts = list(parts)
+        if parts:
+            self.conn.srem(f'extraction:{key}:sent', *parts)
+
+    def _drop(self, pipe, job_id, job_type, status):
+        pipe.delete(*(self._key(job_id, part) for part in ('meta', 'payload', 'events', 'sheet', 'items')))
+        pipe.zrem('jobs:created', job_id)
+        pipe.zrem(f'jobs:status:{status}', job_id)
+        pipe.zrem(f'jobs:type:{job_type}', job_id)
+
+    def evict(self):
+        expired = self.conn.zrangebyscore('jobs:created', '-inf', time.time() - self.ttl)
+        excess = self.conn.zcard('jobs:created') - self.max_count
+        oldest = self.conn.zrange('jobs:created', 0, excess - 1) if excess > 0 else []
+
+        pipe = self.conn.pipeline()
+        for job_id in set(expired) | set(oldest):
+            job_type, status = self.conn.hmget(self._key(job_id), 'type', 'status')
+            if status in FINISHED:
+                self._drop(pipe, job_id, job_type, status)
+        pipe.execute()
+
+
+def make_store(kind=JOB_STORE):
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite':
+        return SqliteJobStore()
+    if kind == 'redis':
+        return RedisJobStore()
+    raise ValueError(f'Unsupported job store: {kind}')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store, created on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_store()
+        return _store
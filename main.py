@@ -1,14 +1,23 @@
-import bot, extract
-from flask import Flask, request, jsonify
-import logging
+import time
+import_started = time.perf_counter()
+
+import dotenv
+# Before the imports below, which read their settings at import time
+dotenv.load_dotenv()
+
+# bot (Selenium) and extract (lxml, bs4, requests) are imported on first use, or preloaded by gunicorn.conf.py
+import jobstore, metrics, scheduler, tasks
+from flask import Flask, g, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import atexit
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
 import threading
-from typing import Dict, List
-import uuid
-from datetime import datetime
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {
@@ -17,106 +26,256 @@ CORS(app, resources={r"/*": {
         "https://orionsoftware.systems"
     ],
     "methods": ["POST", "OPTIONS", "GET"],
-    "allow_headers": ["Content-Type"]
+    "allow_headers": ["Content-Type", "Idempotency-Key"]
 }})
 
-# In-memory job storage (you could also use SQLite for persistence)
-jobs: Dict[str, dict] = {}
-job_lock = threading.Lock()
+# Job storage, SQLite by default so every gunicorn worker sees the same jobs
+jobs = jobstore.get_store()
+
+# 'local' runs jobs in this process, 'rq' hands them to worker.py processes through Redis
+WORKER_MODE = jobstore.WORKER_MODE
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 20))
+QUEUE_RETRY_AFTER = 30
+EVENT_WAIT_MAX = 30
+# Longest a single SSE response stays open before the client has to reconnect
+STREAM_MAX_SECONDS = int(os.getenv('STREAM_MAX_SECONDS', 300))
+
+# Longest a request waits for another with the same Idempotency-Key to finish
+IDEMPOTENCY_WAIT = 30
+
+def claim_idempotency_key(route: str):
+    """Hold the request's Idempotency-Key in the job store, or wait for the request already holding it.
+
+    Returns (key, replay): replay is the earlier request's response for a retry or duplicate.
+    """
+    header = request.headers.get('Idempotency-Key')
+    if not header:
+        return None, None
+    key = f'{route}:{header}'
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while not jobs.reserve_key(key):
+        response = jobs.key_response(key)
+        if response is not None:
+            return None, (jsonify(response), 200)
+        if time.monotonic() >= deadline:
+            return None, (jsonify({"error": "A request with this Idempotency-Key is still running"}), 409, {"Retry-After": "1"})
+        time.sleep(0.1)
+    return key, None
+
+def idempotent(route: str):
+    """Run the view once per Idempotency-Key, replaying its response to retries and concurrent duplicates.
+
+    The key is held from before the upload is read, and released again unless the view
+    remember()s a response, so a rejected request can be retried.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key, replay = claim_idempotency_key(route)
+            if replay:
+                return replay
+            g.idempotency_key = key
+            try:
+                return view(*args, **kwargs)
+            finally:
+                if key and not g.get('idempotency_saved'):
+                    jobs.release_key(key)
+        return wrapper
+    return decorate
+
+def remember(response):
+    """Save the response for this request's Idempotency-Key, if it has one"""
+    key = g.get('idempotency_key')
+    if key:
+        jobs.save_key_response(key, response)
+        g.idempotency_saved = True
+
+# Seconds spent in each startup phase of this process, reported by /health
+startup_seconds = {'import': None, 'preload': None, 'workers': None, 'warm_up': None}
+started_at = time.time()
+started_pid = os.getpid()
+preloaded = False
+
+metrics.gauge('startup_seconds', 'Time spent in each startup phase of this process', ['phase'],
+              lambda: {phase: seconds for phase, seconds in startup_seconds.items() if seconds is not None})
+
+def loaded_bot():
+    """The bot module if a carting job (or warm-up) has imported it yet, else None"""
+    return sys.modules.get('bot')
+
+def shutdown_browsers():
+    bot = loaded_bot()
+    if bot is not None:
+        bot.shutdown_pools()
+
+job_scheduler = None
+
+if WORKER_MODE == 'rq':
+    import worker
+
+    job_queues = {kind: worker.get_queue(kind) for kind in worker.QUEUE_NAMES}
+
+    metrics.gauge('jobs_queued', 'Jobs waiting for a worker', ['kind'],
+                  lambda: {kind: queue.count for kind, queue in job_queues.items()})
+    metrics.gauge('jobs_running', 'Jobs being run by a worker', ['kind'],
+                  lambda: {kind: queue.started_job_registry.count for kind, queue in job_queues.items()})
+else:
+    metrics.gauge('jobs_queued', 'Jobs waiting for a worker', ['kind'],
+                  lambda: {kind: stats['queued'] for kind, stats in job_scheduler.stats().items()} if job_scheduler else {})
+    metrics.gauge('jobs_running', 'Jobs being run by a worker', ['kind'],
+                  lambda: {kind: stats['running'] for kind, stats in job_scheduler.stats().items()} if job_scheduler else {})
+    metrics.gauge('browser_sessions_live', 'Started browser sessions, idle or in use', ['vendor'],
+                  lambda: {vendor: pool.live for vendor, pool in loaded_bot().pools.items()} if loaded_bot() else {})
+
+def start_workers():
+    """Start this process's parse pool and job scheduler in local mode.
 
-# Thread pool for background tasks
-executor = ThreadPoolExecutor(max_workers=5)
+    Runs at import, or in each gunicorn worker after fork (see gunicorn.conf.py) so a
+    preloading master never starts threads or processes its workers would lose.
+    """
+    global job_scheduler
+    if WORKER_MODE == 'rq' or job_scheduler is not None:
+        return
+    start = time.perf_counter()
+
+    # Forked before the scheduler starts its threads, so extract is only imported now if there are any
+    parse_processes = 0
+    if os.getenv('EXTRACT_PROCESSES', '0') != '0':
+        import extract
+        parse_processes = extract.parse_process_count()
+        extract.start_parse_pool(parse_processes)
+        atexit.register(extract.stop_parse_pool)
+
+    # Long-lived workers: 'browser' for Selenium carting, 'extract' for parse + submit
+    job_scheduler = scheduler.from_env(min_extract_workers=parse_processes)
+    atexit.register(job_scheduler.shutdown)
+
+    # Start logged-in browsers up front so the first /add doesn't pay for them
+    if os.getenv('WARM_DRIVER_POOL') == '1':
+        import bot
+        bot.warm_pools()
+    atexit.register(shutdown_browsers)
+
+    startup_seconds['workers'] = round(time.perf_counter() - start, 3)
+
+def preload():
+    """Import the heavy modules once in the gunicorn master, so every worker forks with them loaded"""
+    start = time.perf_counter()
+    import extract
+    if WORKER_MODE != 'rq':
+        import bot
+    startup_seconds['preload'] = round(time.perf_counter() - start, 3)
+
+def warm_up():
+    """Import anything not preloaded and warm the parsers and the form connection pool"""
+    start = time.perf_counter()
+    try:
+        import extract
+        extract.warm_parsers()
+        # With rq the carting and submitting happen in worker.py, not here
+        if WORKER_MODE != 'rq':
+            import bot
+            extract.warm_http_pool()
+    except Exception as e:
+        print(f'-> Warm-up failed: {e}')
+    startup_seconds['warm_up'] = round(time.perf_counter() - start, 3)
+
+def after_fork():
+    """Called by gunicorn.conf.py in each worker: start its workers, then warm up in the background"""
+    global started_at, started_pid, preloaded
+    if started_pid != os.getpid():
+        # Imported by the master, so this worker's own startup begins at the fork
+        started_at, started_pid, preloaded = time.time(), os.getpid(), True
+    start_workers()
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+def submit_job(kind: str, fn, *args, vendors=()):
+    if WORKER_MODE != 'rq':
+        job_scheduler.submit(kind, fn, *args, vendors=vendors)
+        return
+
+    queue = job_queues[kind]
+    if queue.count >= JOB_QUEUE_SIZE:
+        raise scheduler.QueueFull(kind)
+    # The rq job shares our job id; its own result is not needed since tasks write to the store
+    queue.enqueue(fn, *args, job_id=args[0], result_ttl=0, failure_ttl=24 * 60 * 60)
 
 def create_job(job_type: str, status: str = "pending") -> str:
     """Create a new job entry"""
-    job_id = str(uuid.uuid4())
-    with job_lock:
-        jobs[job_id] = {
-            "id": job_id,
-            "type": job_type,
-            "status": status,
-            "created_at": datetime.now().isoformat(),
-            "result": None,
-            "error": None
-        }
-    return job_id
-
-def update_job(job_id: str, status: str, result=None, error=None):
-    """Update job status"""
-    with job_lock:
-        if job_id in jobs:
-            jobs[job_id]["status"] = status
-            if result:
-                jobs[job_id]["result"] = result
-            if error:
-                jobs[job_id]["error"] = error
-
-async def async_add_to_cart(job_id: str, csv_data):
-    """Async wrapper for bot.add_to_cart"""
+    return jobs.create(job_type, status)
+
+def enqueue_job(job_id: str, kind: str, fn, *args, vendors=()):
+    """Queue a job, returning an error response if the scheduler can't take it"""
     try:
-        update_job(job_id, "processing")
-        # If bot.add_to_cart is synchronous, run it in executor
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(executor, bot.add_to_cart, csv_data)
-        update_job(job_id, "completed", result=result)
-    except Exception as e:
-        update_job(job_id, "failed", error=str(e))
+        submit_job(kind, fn, job_id, *args, vendors=vendors)
+        return None
+    except scheduler.QueueFull:
+        metrics.failures.inc(cause="queue_full")
+        jobs.update(job_id, "failed", error="Rejected: job queue is full")
+        return jsonify({"error": "Too many jobs queued, try again shortly"}), 429, {"Retry-After": str(QUEUE_RETRY_AFTER)}
+    except scheduler.SchedulerClosed:
+        metrics.failures.inc(cause="shutting_down")
+        jobs.update(job_id, "failed", error="Rejected: server is shutting down")
+        return jsonify({"error": "Server is shutting down"}), 503, {"Retry-After": str(QUEUE_RETRY_AFTER)}
+
+def spool_order_sheet(stream):
+    """Validate an order sheet line by line while copying it to a temp file.
 
-async def async_extract(job_id: str, vendor: str, filename: str, html_content: str, name: str, subteam: str):
-    """Async wrapper for extract functions"""
+    Returns (path, vendors, errors); the file is removed again if any row is invalid.
+    """
+    import extract
+
+    errors = []
+    vendors = set()
+    fd, path = tempfile.mkstemp(prefix='order-', suffix='.txt')
     try:
-        update_job(job_id, "processing")
-        loop = asyncio.get_event_loop()
-        
-        if vendor == "MetalSupermarkets":
-            result = await loop.run_in_executor(
-                executor, 
-                extract.metal_supermarkets, 
-                html_content,
-                name,
-                subteam
-            )
-        elif vendor == "McMaster":
-            result = await loop.run_in_executor(
-                executor,
-                extract.mcmaster,
-                html_content,
-                name,
-                subteam
-            )
-        else:
-            raise ValueError(f"Unsupported vendor: {vendor}")
-            
-        update_job(job_id, "completed", result=result)
-    except Exception as e:
-        update_job(job_id, "failed", error=str(e))
-
-def run_async_task(coro):
-    """Run async task in background"""
-    def run_in_thread():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(coro)
-        loop.close()
-    
-    thread = threading.Thread(target=run_in_thread)
-    thread.start()
+        with os.fdopen(fd, 'w', encoding='utf-8') as spool:
+            def lines():
+                for line in io.TextIOWrapper(stream, encoding='utf-8', newline=''):
+                    line = line.rstrip('\r\n')
+                    spool.write(line + '\n')
+                    yield line
+
+            for _, vendor, _ in extract.iter_order_rows(lines(), errors=errors):
+                vendors.add(vendor)
+    except BaseException:
+        # e.g. UnicodeDecodeError on a sheet that isn't UTF-8
+        os.remove(path)
+        raise
+
+    if errors:
+        os.remove(path)
+    return path, vendors, errors
 
 @app.route('/add', methods=['POST'])
+@idempotent('add')
 def get_information():
     file = request.files['file']
-    csv_data = file.stream.read().decode("utf-8").splitlines()
-    
-    # Create job and run async
+    try:
+        path, vendors, errors = spool_order_sheet(file.stream)
+    except UnicodeDecodeError:
+        return jsonify({"error": "Order sheet must be UTF-8 text"}), 400
+    if errors:
+        return jsonify({"error": "Invalid rows in order sheet", "rows": errors}), 400
+
+    # The sheet goes into the job store, which rq workers share, and stays there for resuming
+    import extract
     job_id = create_job("add_to_cart")
-    run_async_task(async_add_to_cart(job_id, csv_data))
-    
-    return jsonify({
+    jobs.save_sheet(job_id, extract.iter_file_lines(path))
+    rejected = enqueue_job(job_id, "browser", tasks.run_add_to_cart, vendors=vendors)
+    if rejected:
+        return rejected
+
+    response = {
         "message": "Items are being added to cart",
         "job_id": job_id
-    }), 200  # 200 Accepted for async processing
+    }
+    remember(response)
+    
+    return jsonify(response), 200  # 200 Accepted for async processing
 
 @app.route('/request', methods=['POST'])
+@idempotent('request')
 def request_parts():
     print('method called')
     
@@ -134,6 +293,8 @@ def request_parts():
     if not files or all(f.filename == '' for f in files):
         return jsonify({"error": "No file selected"}), 400
 
+    import extract
+
     job_ids = []
     errors = []
 
@@ -152,35 +313,172 @@ def request_parts():
             continue
 
         try:
-            html_content = file.read().decode("utf-8")
+            # Spooled to disk and parsed from there, so queued uploads don't sit in memory
+            upload = extract.SpooledUpload.from_stream(vendor, file.stream)
+            if WORKER_MODE == 'rq':
+                # Workers may be on another machine, so they get the bytes rather than the path
+                html_content = upload.read()
+                upload.remove()
+            else:
+                html_content = upload
             
-            # Create job and run async
+            # Create job and queue it
             job_id = create_job(f"extract_{vendor}")
-            run_async_task(async_extract(job_id, vendor, filename, html_content, name, subteam))
+            rejected = enqueue_job(job_id, "extract", tasks.run_extract, vendor, filename, html_content, name, subteam)
+            if rejected:
+                upload.remove()
+                if not job_ids:
+                    return rejected
+                errors.append(f"Queue full, not processed: {filename}")
+                continue
             job_ids.append({"file": filename, "job_id": job_id})
 
         except Exception as e:
             errors.append(f"Failed to read {filename}: {str(e)}")
     
-    return jsonify({
+    response = {
         "message": f"{len(job_ids)} file(s) queued for processing",
         "jobs": job_ids,
         "errors": errors
-    }), 200
+    }
+    if job_ids:
+        remember(response)
+
+    return jsonify(response), 200
 
 @app.route('/job/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     """Check job status"""
-    with job_lock:
-        if job_id not in jobs:
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/job/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Re-run a finished or orphaned add_to_cart job for only the order lines that failed or never finished"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['type'] != 'add_to_cart':
+        return jsonify({"error": "Only order sheet jobs can be resumed"}), 400
+    # A job stuck pending or processing past JOB_STALE_SECONDS lost its worker and can be resumed too
+    if not jobstore.resumable(job, jobs.stale_after):
+        return jsonify({"error": f"Job is {job['status']}, wait for it to finish"}), 409
+
+    import extract
+    done = tasks.carted_rows(job)
+    remaining = [(line, vendor) for line, vendor, _ in extract.iter_order_rows(jobs.sheet(job_id)) if line not in done]
+    if not remaining:
+        return jsonify({"message": "Every line is already in the cart", "job_id": job_id, "lines": 0}), 200
+
+    if not jobs.resume(job_id):
+        return jsonify({"error": "Job is already being resumed"}), 409
+    rejected = enqueue_job(job_id, "browser", tasks.run_add_to_cart, vendors={vendor for _, vendor in remaining})
+    if rejected:
+        return rejected
+
+    return jsonify({
+        "message": f"Resuming {len(remaining)} of the order's lines",
+        "job_id": job_id,
+        "lines": len(remaining)
+    }), 200
+
+def is_finished(event):
+    return event['type'] == 'status' and event['status'] in jobstore.FINISHED
+
+@app.route('/job/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """Long-poll for progress events after ?since=<seq>, waiting up to ?wait=<seconds>"""
+    since = max(request.args.get('since', 0, type=int), 0)
+    wait = min(max(request.args.get('wait', 25, type=float), 0), EVENT_WAIT_MAX)
+
+    events = jobs.events(job_id, since)
+    if not events:
+        if jobs.get(job_id) is None:
             return jsonify({"error": "Job not found"}), 404
-        return jsonify(jobs[job_id])
+        events = jobs.wait_events(job_id, since, wait)
+
+    return jsonify({
+        "events": events,
+        "next": events[-1]["seq"] if events else since,
+        "done": any(is_finished(event) for event in events)
+    })
+
+@app.route('/job/<job_id>/stream', methods=['GET'])
+def stream_job_events(job_id):
+    """Server-sent progress events until the job completes or fails.
+
+    The stream closes after STREAM_MAX_SECONDS so it doesn't hold a gunicorn thread for the
+    whole job; EventSource reconnects and resumes from its Last-Event-ID.
+    """
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    try:
+        since = max(int(request.headers.get('Last-Event-ID') or request.args.get('since', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID and since must be event numbers"}), 400
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+
+    def generate():
+        nonlocal since
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = jobs.wait_events(job_id, since, min(EVENT_WAIT_MAX, remaining))
+            if not events:
+                # Expired or deleted while we waited
+                if jobs.get(job_id) is None:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                since = event["seq"]
+                yield f"id: {since}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if is_finished(event):
+                    return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route('/jobs', methods=['GET'])
 def get_all_jobs():
-    """Get all jobs (optional, for monitoring)"""
-    with job_lock:
-        return jsonify(list(jobs.values()))
+    """List jobs newest first, without results (optional, for monitoring)"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify(jobs.list(
+        status=request.args.get('status'),
+        job_type=request.args.get('type'),
+        limit=max(limit, 0),
+        offset=max(offset, 0)
+    ))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this process's metrics"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness, with this process's startup timings and whether the heavy modules are loaded yet"""
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "worker_mode": WORKER_MODE,
+        "preloaded": preloaded,
+        "uptime_seconds": round(time.time() - started_at, 3),
+        "startup_seconds": startup_seconds,
+        "loaded": {name: name in sys.modules for name in ('extract', 'bot')}
+    })
+
+startup_seconds['import'] = round(time.perf_counter() - import_started, 3)
+
+# gunicorn.conf.py sets this and calls after_fork() in each worker instead
+if os.getenv('DEFER_STARTUP') != '1':
+    start_workers()
 
 if __name__ == '__main__':
     app.run(debug=True, threaded=True)  # Enable threading
\ No newline at end of file
@@ -0,0 +1,158 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """One metric family with fixed label names, rendered in Prometheus text format"""
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, key, extra, value in self.samples():
+            lines.append(f'{name}{_labels(self.label_names, key, extra)} {_number(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge set directly, or read from collect() -> {label values: value} at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f'-> Failed to collect {self.name}: {e}')
+            return []
+        return [(self.name, key if isinstance(key, tuple) else (key,), (), value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + seconds)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', key, (('le', _number(bound)),), count))
+                samples.append((f'{self.name}_sum', key, (), total))
+                samples.append((f'{self.name}_count', key, (), counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# Per process: with several gunicorn or rq workers each one exposes its own numbers
+registry = Registry()
+
+parse_seconds = registry.register(Histogram(
+    'cart_parse_seconds', 'Time to parse an uploaded cart page', ['vendor']))
+submit_seconds = registry.register(Histogram(
+    'form_submit_seconds', 'Latency of one part request form submission', ['outcome']))
+browser_step_seconds = registry.register(Histogram(
+    'browser_step_seconds', 'Time spent in each carting step, including page loads', ['step']))
+job_seconds = registry.register(Histogram(
+    'job_duration_seconds', 'Job run time from start to completion or failure', ['type', 'status'], JOB_BUCKETS))
+failures = registry.register(Counter(
+    'failures_total', 'Failures by cause', ['cause']))
+
+
+def gauge(name, help, labels, collect):
+    """Register a gauge read from collect() whenever /metrics is scraped"""
+    return registry.register(Gauge(name, help, labels, collect))
+
+
+def render():
+    return registry.render()
+
+
+def no_progress(kind, **data):
+    """Default progress callback for flows run outside a job"""
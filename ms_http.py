@@ -0,0 +1,145 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import planner
+
+MS_BASE_URL = os.getenv('MS_BASE_URL', 'https://www.metalsupermarkets.com')
+MS_CART_ENDPOINT = os.getenv('MS_CART_ENDPOINT', f'{MS_BASE_URL}/wp-admin/admin-ajax.php')
+MS_HTTP_WORKERS = int(os.getenv('MS_HTTP_WORKERS', 4))
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def make_session(cookies=(), workers=MS_HTTP_WORKERS):
+    """requests.Session with a connection pool sized for workers, seeded with browser cookies"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+    return session
+
+
+def session_from_driver(driver, workers=MS_HTTP_WORKERS):
+    session = make_session(driver.get_cookies(), workers)
+    session.headers['User-Agent'] = driver.execute_script('return navigator.userAgent;')
+    return session
+
+
+def row_fields(tree, sku):
+    """Form fields of the product row for sku, or None if the page has no such row"""
+    rows = tree.xpath('//tr[.//input[@name="pro_sku" and @value=$sku]]', sku=sku)
+    if not rows:
+        return None
+
+    fields = {}
+    for input in rows[0].iter('input'):
+        key = input.get('name') or (input.get('class') or '').split(' ')[0]
+        if key:
+            fields[key] = input.get('value', '')
+
+    for button in rows[0].find_class('addtocart'):
+        for attr, value in button.attrib.items():
+            if attr.startswith('data-'):
+                fields.setdefault(attr[5:].replace('-', '_'), value)
+    return fields
+
+
+def added(response):
+    """Whether the response confirms the add: JSON with success true, or WooCommerce's cart fragments.
+
+    Anything else counts as failed, including a login or error page served with a 200.
+    """
+    if not response.ok:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    if not isinstance(body, dict) or body.get('error'):
+        return False
+    return body.get('success') is True or bool(body.get('fragments'))
+
+
+def never_sent(error):
+    """Whether a failed add died before its request reached the server, so it can't have landed"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # Refused or unresolvable; a connection dropped mid-response may still have added the item
+    return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+
+
+def add_page(session, link, items, endpoint=MS_CART_ENDPOINT, timings=None):
+    """Add every MsLine on one product page.
+
+    Returns (unsent, unconfirmed): lines whose add never reached the server, which are safe to
+    retry another way, and lines that were sent but not confirmed, which may be in the cart.
+    """
+    unsent, unconfirmed = [], []
+    try:
+        page = session.get(link, timeout=15)
+        page.raise_for_status()
+    except requests.RequestException as e:
+        print(f'-> HTTP fetch failed for {link}: {e}')
+        return list(items), []
+
+    tree = lxml.html.fromstring(page.content)
+    for item in items:
+        fields = row_fields(tree, item.pro_sku)
+        if fields is None:
+            print(f"-> No row for {item.pro_sku} on {link}")
+            unsent.append(item)
+            continue
+
+        for key in ('pro_sku', 'pro_length', 'pro_width', 'sel_quantity'):
+            if getattr(item, key) is not None:
+                fields[key] = getattr(item, key)
+        fields['action'] = 'addtocart'
+
+        start = time.perf_counter()
+        try:
+            response = session.post(endpoint, data=fields, headers={'Referer': link}, timeout=15)
+            ok = added(response)
+            if not ok:
+                print(f"-> HTTP add of {item.pro_sku} not confirmed (status {response.status_code})")
+        except requests.RequestException as e:
+            print(f"-> HTTP add failed for {item.pro_sku}: {e}")
+            ok = False
+            if never_sent(e):
+                unsent.append(item)
+                continue
+        finally:
+            if timings:
+                timings.record('http add', time.perf_counter() - start)
+
+        if ok:
+            print(f"-> Successfully added {item.pro_sku} to cart over HTTP.")
+        else:
+            unconfirmed.append(item)
+    return unsent, unconfirmed
+
+
+def add_items(session, data, endpoint=MS_CART_ENDPOINT, workers=MS_HTTP_WORKERS, timings=None):
+    """Add items with one page fetch per product, pages in parallel.
+
+    Returns (unsent, unconfirmed) as add_page does, across every page.
+    """
+    pages = planner.group_by_page(data)
+    unsent, unconfirmed = [], []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pages)))) as page_executor:
+        for page_unsent, page_unconfirmed in page_executor.map(lambda page: add_page(session, page[0], page[1], endpoint, timings), pages):
+            unsent += page_unsent
+            unconfirmed += page_unconfirmed
+    return unsent, unconfirmed
@@ -0,0 +1,108 @@
+from collections import Counter
+
+from cart import CartBatch
+
+
+def merge_lines(vendor, data):
+    """Combine lines for the same part and dimensions, summing their quantities.
+
+    Returns (lines, merges) where lines is a CartBatch and merges lists every part that was combined.
+    """
+    merged = {}
+    counts = {}
+    for line in data:
+        key = line.merge_key()
+        if key in merged:
+            merged[key] = merged[key].merge(line)
+            counts[key] += 1
+        else:
+            merged[key] = line
+            counts[key] = 1
+
+    merges = [
+        {'part_number': merged[key].part_number, 'lines': count, 'quantity': merged[key].quantity}
+        for key, count in counts.items() if count > 1
+    ]
+    return CartBatch(vendor, merged.values()), merges
+
+
+def group_by_page(data):
+    """[(link, [MsLine])] in first-seen order, so every product page is loaded once"""
+    pages = {}
+    for line in data:
+        pages.setdefault(line.pro_link, []).append(line)
+    return list(pages.items())
+
+
+def _dimension(value):
+    """Cut dimension in a comparable form, so '16', '16.0' and ' 16 ' match"""
+    value = (value or '').strip()
+    try:
+        return repr(float(value))
+    except ValueError:
+        return value.lower() or None
+
+
+def cart_key(line):
+    """What identifies a line in the vendor's cart, which shows neither the sheet's link nor (McMaster) its attribute"""
+    if line.vendor == 'McMaster':
+        return (line.part_number or '').strip().upper()
+    return ((line.pro_sku or '').strip().upper(), _dimension(line.pro_length), _dimension(line.pro_width))
+
+
+def cart_quantities(lines):
+    """Counter of quantity already in a cart, by cart_key, from lines parsed off the cart page"""
+    quantities = Counter()
+    for line in lines:
+        quantity = (line.quantity or '').strip()
+        if quantity.isdigit():
+            quantities[cart_key(line)] += int(quantity)
+    return quantities
+
+
+def subtract_cart(vendor, lines, in_cart):
+    """Drop lines in_cart already covers and cut the rest to the quantity still missing.
+
+    in_cart is used up as it's matched, so each unit in the cart covers one line at most.
+    Returns (lines to add, lines already in the cart, how many lines were cut).
+    """
+    to_add = []
+    covered = []
+    cut = 0
+    for line in lines:
+        key = cart_key(line)
+        wanted = int(line.quantity)
+        have = min(in_cart[key], wanted)
+        in_cart[key] -= have
+        if have == wanted:
+            covered.append(line)
+        elif have:
+            to_add.append(line.with_quantity(str(wanted - have)))
+            cut += 1
+        else:
+            to_add.append(line)
+    return CartBatch(vendor, to_add), covered, cut
+
+
+def plan(vendor, data, report=None, in_cart=None):
+    """Merge an order's lines for one vendor for carting and add what was done to report.
+
+    Given in_cart (see cart_quantities), only what the vendor's cart is missing is planned.
+    Returns (lines, report, lines already in the cart).
+    """
+    lines, merges = merge_lines(vendor, data)
+
+    report = report if report is not None else {}
+    report['lines'] = report.get('lines', 0) + len(data)
+    report.setdefault('merges', []).extend(merges)
+
+    covered = []
+    if in_cart is not None:
+        lines, covered, cut = subtract_cart(vendor, lines, in_cart)
+        report['in_cart_lines'] = report.get('in_cart_lines', 0) + len(covered)
+        report['topped_up_lines'] = report.get('topped_up_lines', 0) + cut
+
+    report['carted_lines'] = report.get('carted_lines', 0) + len(lines)
+    if vendor == 'MetalSupermarkets':
+        report['page_loads'] = report.get('page_loads', 0) + len(set(lines.column('pro_link')))
+    return lines, report, covered
@@ -0,0 +1,595 @@
+"""Record vendor pages and replay the bot's cart flows against a local stand-in.
+
+    python replay.py run --lines 50 --latency 0.1 --ajax-latency 0.3   # full cart run, per-step timings
+    python replay.py serve                                             # just the stand-in sites
+    python replay.py record McMaster https://www.mcmaster.com/order    # snapshot pages with a logged-in driver
+    python replay.py run --assets 20 --asset-latency 0.2 --profile both  # default vs lean browser profile
+    python replay.py run --prefill 0.8 --cart-mode delta                # incremental order on a part-filled cart
+
+The stand-in reproduces the DOM the bot relies on (login forms, price-loader, addtocart,
+order-pad-line, switch-mode-link, bulk-lines-textarea) and delays every page and ajax call by a
+configurable latency. With --assets every page also carries images, web fonts and an async
+third-party tracker script, so the lean browser profile's blocking can be measured. Recorded snapshots are served in place of the built-in pages for the same
+path, with the vendor's scripts and external resources stripped and the stand-in behaviour injected.
+"""
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+import lxml.html
+
+import extract
+
+SNAPSHOT_DIR = os.getenv('REPLAY_SNAPSHOT_DIR', 'snapshots')
+SESSION_COOKIE = 'replay_session'
+
+# Stands in for jQuery's in-flight counter so waits.network_idle sees the stand-in's requests
+TRACK_JS = """
+window.jQuery = window.jQuery || {active: 0};
+function track(request) {
+    window.jQuery.active++;
+    return request.finally(() => { window.jQuery.active--; });
+}
+"""
+
+MS_JS = TRACK_JS + """
+document.addEventListener('input', (event) => {
+    const row = event.target.closest('tr');
+    const loader = row && row.querySelector('.price-loader');
+    if (!loader) return;
+    row.pending = (row.pending || 0) + 1;
+    loader.style.display = 'block';
+    const sku = row.querySelector('input[name="pro_sku"]').value;
+    track(fetch('/price?sku=' + encodeURIComponent(sku))).then(() => {
+        if (--row.pending === 0) loader.style.display = 'none';
+    });
+});
+document.addEventListener('click', (event) => {
+    const button = event.target.closest('.addtocart');
+    if (!button) return;
+    event.preventDefault();
+    const body = new URLSearchParams({action: 'addtocart'});
+    for (const input of button.closest('tr').querySelectorAll('input')) {
+        body.append(input.name || input.className.split(' ')[0], input.value);
+    }
+    track(fetch('/wp-admin/admin-ajax.php', {method: 'POST', body: body, credentials: 'same-origin'}));
+});
+"""
+
+MC_JS = TRACK_JS + """
+function show(selector, visible) {
+    for (const el of document.querySelectorAll(selector)) el.style.display = visible ? '' : 'none';
+}
+document.addEventListener('click', (event) => {
+    if (event.target.closest('#LoginUsrCtrlWebPart_LoginLnk')) {
+        event.preventDefault();
+        show('#login-form', true);
+    } else if (event.target.closest('.order-pad-add-line')) {
+        event.preventDefault();
+        show('.switch-mode-link', true);
+    } else if (event.target.closest('.switch-mode-link')) {
+        event.preventDefault();
+        show('.switch-mode-link', false);
+        show('#bulk-lines', true);
+    } else if (event.target.closest('.button-add-bulk-lines')) {
+        event.preventDefault();
+        const textarea = document.getElementById('bulk-lines-textarea');
+        const lines = document.querySelectorAll('[class="order-pad-line"]');
+        const pad = document.getElementById('order-pad-lines') || (lines.length ? lines[lines.length - 1].parentNode : document.body);
+        track(fetch('/order/bulk', {method: 'POST', body: textarea.value, credentials: 'same-origin'})
+            .then((response) => response.text())
+            .then((rows) => {
+                pad.insertAdjacentHTML('beforeend', rows);
+                textarea.value = '';
+                show('#bulk-lines', false);
+                show('.order-pad-add-line', true);
+            }));
+    }
+});
+"""
+
+# 1x1 transparent PNG, served for every stand-in image
+PIXEL = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082'
+)
+ASSET_TYPES = {'.png': 'image/png', '.woff2': 'font/woff2', '.js': 'text/javascript'}
+
+PAGE = '<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title></head><body>{body}<script>{script}</script></body></html>'
+
+
+def ms_product_row(sku):
+    return (
+        f'<tr><td><input type="hidden" name="pro_sku" value="{html.escape(sku)}">{html.escape(sku)}</td>'
+        '<td><input class="pro_length form-control" value=""></td>'
+        '<td><input class="pro_width form-control" value=""></td>'
+        '<td><input class="sel_quantity form-control" value="1"></td>'
+        '<td class="productbtn"><div class="price-loader" style="display:none">Updating price...</div>'
+        f'<button class="addtocart" data-product-sku="{html.escape(sku)}">Add to cart</button></td></tr>'
+    )
+
+
+def ms_cart_item(index, item):
+    # html_ms rebuilds the product link from the name, so name it after the page it was added from
+    name = item.get('page', '').rstrip('/').rsplit('/', 1)[-1].replace('-', ' ') or item.get('pro_sku', '')
+    width = f'<input class="pro_width form-control" value="{html.escape(item["pro_width"])}">' if item.get('pro_width') else ''
+    return (
+        f'<div id="cartitem_{index}" class="cart-item"><h3 class="product-name">{html.escape(name)}</h3>'
+        f'<p class="product-info">{html.escape(item.get("pro_sku", ""))}</p>'
+        f'<input name="pro_sku" value="{html.escape(item.get("pro_sku", ""))}">'
+        f'<input class="pro_length form-control" value="{html.escape(item.get("pro_length", ""))}">{width}'
+        f'<input name="sel_quantity" value="{html.escape(item.get("sel_quantity", ""))}"></div>'
+    )
+
+
+def mc_order_line(index, part_number, quantity):
+    return (
+        f'<div class="order-pad-line"><input id="line-part-number-input-{index}" value="{html.escape(part_number)}">'
+        f'<input id="line-quantity-input-{index}" value="{html.escape(quantity)}">'
+        '<div class="line-unit-price">$1.00 each</div>'
+        f'<div class="line-title title-text">Part {html.escape(part_number)}</div>'
+        '<div class="line-description description-print--view">Stand-in part</div></div>'
+    )
+
+
+def page_assets(count, third_party_url):
+    """Images, fonts and a tracker like a real vendor page carries, none of which the bot needs"""
+    fonts = ''.join(f'@font-face{{font-family:f{i};src:url(/assets/font-{i}.woff2)}}' for i in range(count // 4 + 1))
+    families = ','.join(f'f{i}' for i in range(count // 4 + 1))
+    images = ''.join(f'<img src="/assets/image-{i}.png" width="1" height="1">' for i in range(count))
+    return (
+        f'<style>{fonts} body{{font-family:{families}}}</style>{images}'
+        f'<script async src="{third_party_url}/assets/tracker.js"></script>'
+    )
+
+
+def load_snapshot(vendor, path, script):
+    """Recorded page for path with its scripts and external resources replaced by the stand-in's, or None"""
+    directory = os.path.join(SNAPSHOT_DIR, vendor)
+    try:
+        with open(os.path.join(directory, 'index.json'), 'r', encoding='utf-8') as f:
+            filename = json.load(f).get(path)
+    except (OSError, ValueError):
+        return None
+    if not filename:
+        return None
+
+    with open(os.path.join(directory, filename), 'rb') as f:
+        root = lxml.html.fromstring(f.read())
+    for element in root.xpath('//script | //iframe | //link[@rel="preload" or @rel="stylesheet"]'):
+        element.drop_tree()
+    for element in root.xpath('//*[@src]'):
+        if urlsplit(element.get('src')).netloc:
+            del element.attrib['src']
+
+    shim = lxml.html.fragment_fromstring(f'<script>{script}</script>')
+    body = root.find('body')
+    (body if body is not None else root).append(shim)
+    return lxml.html.tostring(root, doctype='<!DOCTYPE html>')
+
+
+class StandIn:
+    """Local stand-in for one vendor site, holding the cart it has been given"""
+
+    def __init__(self, vendor, latency=0.0, ajax_latency=0.0, catalog=None, assets=0, asset_latency=0.0):
+        self.vendor = vendor
+        self.latency = latency
+        self.ajax_latency = ajax_latency
+        # MetalSupermarkets product page slug -> SKUs listed on it
+        self.catalog = catalog if catalog is not None else {}
+        self.assets = assets
+        self.asset_latency = asset_latency
+        self.assets_served = 0
+        self.cart = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def third_party_host(self):
+        # Same server under another host name, so the browser treats it as a third party
+        return f'localhost:{self.server.server_port}'
+
+    def start(self, port=0):
+        handler = type('Handler', (StandInHandler,), {'site': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add(self, item):
+        with self.lock:
+            self.cart.append(item)
+            return len(self.cart)
+
+    def reset(self):
+        with self.lock:
+            self.cart.clear()
+            self.assets_served = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    site = None
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def logged_in(self):
+        return f'{SESSION_COOKIE}=' in self.headers.get('Cookie', '')
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+
+    def respond(self, status, content=b'', content_type='text/html; charset=utf-8', headers=()):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def redirect(self, location, login=False):
+        headers = [('Location', location)]
+        if login:
+            headers.append(('Set-Cookie', f'{SESSION_COOKIE}=1; Path=/'))
+        self.respond(302, headers=headers)
+
+    def page(self, title, body):
+        script = MS_JS if self.site.vendor == 'MetalSupermarkets' else MC_JS
+        snapshot = load_snapshot(self.site.vendor, urlsplit(self.path).path, script)
+        if self.site.assets:
+            body += page_assets(self.site.assets, f'http://{self.site.third_party_host}')
+        self.respond(200, snapshot or PAGE.format(title=title, body=body, script=script))
+
+    def asset(self, path):
+        time.sleep(self.site.asset_latency)
+        with self.site.lock:
+            self.site.assets_served += 1
+        extension = os.path.splitext(path)[1]
+        self.respond(200, PIXEL if extension == '.png' else b'/* stand-in */', ASSET_TYPES.get(extension, 'application/octet-stream'))
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/price':
+            time.sleep(self.site.ajax_latency)
+            return self.respond(200, '{"success": true}', 'application/json')
+        if path.startswith('/assets/'):
+            return self.asset(path)
+
+        time.sleep(self.site.latency)
+        if self.site.vendor == 'MetalSupermarkets':
+            self.ms_get(path)
+        else:
+            self.mc_get(path)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == '/login':
+            self.body()
+            time.sleep(self.site.latency)
+            return self.redirect('/my-account' if self.site.vendor == 'MetalSupermarkets' else '/', login=True)
+
+        time.sleep(self.site.ajax_latency)
+        if path == '/wp-admin/admin-ajax.php':
+            fields = {key: values[0] for key, values in parse_qs(self.body()).items()}
+            if not self.logged_in or fields.get('action') != 'addtocart':
+                return self.respond(200, '0', 'text/plain')
+            fields['page'] = urlsplit(self.headers.get('Referer', '')).path
+            self.site.add(fields)
+            return self.respond(200, '{"success": true}', 'application/json')
+
+        if path == '/order/bulk' and self.logged_in:
+            rows = []
+            for line in self.body().splitlines():
+                if ',' not in line:
+                    continue
+                part_number, quantity = (value.strip() for value in line.split(',', 1))
+                rows.append(mc_order_line(self.site.add({'part_number': part_number, 'quantity': quantity}), part_number, quantity))
+            return self.respond(200, ''.join(rows))
+        self.respond(404, 'Not found')
+
+    def ms_get(self, path):
+        if path == '/login':
+            return self.page('Login', (
+                '<div id="CybotCookiebotDialog"><button id="CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll" '
+                'onclick="this.parentNode.style.display=\'none\'">Allow all</button></div>'
+                '<form id="loginform" method="post" action="/login"><input name="msm_email"><input name="msm_password" type="password">'
+                '<button type="submit">Sign in</button></form>'
+            ))
+        if not self.logged_in and path in ('/my-account', '/cart'):
+            return self.redirect('/login')
+        if path == '/my-account':
+            return self.page('My account', '<h1>My account</h1>')
+        if path == '/cart':
+            with self.site.lock:
+                items = ''.join(ms_cart_item(i, item) for i, item in enumerate(self.site.cart))
+            return self.page('Cart', items)
+        if path.startswith('/product/'):
+            skus = self.site.catalog.get(path[len('/product/'):].strip('/'))
+            if skus is not None:
+                return self.page('Product', f'<table class="product-table">{"".join(ms_product_row(sku) for sku in skus)}</table>')
+        if path == '/':
+            return self.page('Metal Supermarkets', '<h1>Metal Supermarkets</h1>')
+        self.respond(404, 'Not found')
+
+    def mc_get(self, path):
+        if path == '/':
+            if self.logged_in:
+                return self.page('McMaster-Carr', '<a href="/order">Order</a> <a href="/logout">Log out</a>')
+            return self.page('McMaster-Carr', (
+                '<a id="LoginUsrCtrlWebPart_LoginLnk" href="#">Log in</a>'
+                '<form id="login-form" method="post" action="/login" style="display:none"><input id="Email" name="Email">'
+                '<input id="Password" name="Password" type="password"><input type="submit" value="Log in"></form>'
+            ))
+        if path == '/order':
+            if not self.logged_in:
+                return self.redirect('/')
+            with self.site.lock:
+                lines = ''.join(mc_order_line(i, item['part_number'], item['quantity']) for i, item in enumerate(self.site.cart, start=1))
+            # With lines in the pad, bulk entry is behind "add line" like on the real order pad
+            hidden = ' style="display:none"'
+            return self.page('Order', (
+                f'<div id="order-pad-lines">{lines}</div>'
+                f'<a class="order-pad-add-line" href="#"{"" if lines else hidden}>Add line</a>'
+                f'<a class="switch-mode-link" href="#"{hidden if lines else ""}>Paste multiple lines</a>'
+                f'<div id="bulk-lines"{hidden}><textarea id="bulk-lines-textarea"></textarea>'
+                '<button class="button-add-bulk-lines">Add to order</button></div>'
+            ))
+        self.respond(404, 'Not found')
+
+
+def synthetic_order(lines, ms_url, mc_url, per_page=4):
+    """Order sheet rows split between vendors, and the MetalSupermarkets catalog that covers them"""
+    pages = max(1, lines // (2 * per_page))
+    catalog = {}
+    rows = []
+    for i in range(lines):
+        if i % 2:
+            slug = f'flat-bar-{i % pages}'
+            sku = f'MS{i:06d}'
+            catalog.setdefault(slug, []).append(sku)
+            dims = f'{12 + i % 60} X {1 + i % 12}' if i % 3 else f'{12 + i % 60}'
+            rows.append(f'FALSE||TRUE||Replay||Frame||MetalSupermarkets||{sku}||Flat bar||10.00||{1 + i % 4}||{dims}||{ms_url}/product/{slug}')
+        else:
+            rows.append(f'FALSE||TRUE||Replay||Frame||McMaster||{91000 + i}A{i % 100}||Screw||0.50||{1 + i % 10}||||{mc_url}/order')
+    return rows, catalog
+
+
+def localize(link, base_url):
+    """link with its scheme and host swapped for base_url's"""
+    parts = urlsplit(link)
+    base = urlsplit(base_url)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+
+def localize_sheet(lines, ms_url, mc_url):
+    """Point a real order sheet's product links at the stand-ins"""
+    rows = []
+    for line in lines:
+        fields = line.split('||')
+        if len(fields) >= 11 and fields[10].strip():
+            base = ms_url if fields[4].strip() == 'MetalSupermarkets' else mc_url
+            fields[10] = localize(fields[10].strip(), base)
+        rows.append('||'.join(fields))
+    return rows
+
+
+def point_bot_at(ms_url, mc_url, engine):
+    """Environment for importing bot against the stand-ins, with a throwaway session cache"""
+    os.environ['MS_BASE_URL'] = ms_url
+    os.environ['MC_BASE_URL'] = mc_url
+    os.environ['MS_CART_ENDPOINT'] = f'{ms_url}/wp-admin/admin-ajax.php'
+    os.environ['MS_CART_ENGINE'] = engine
+    os.environ['SESSION_CACHE_DIR'] = tempfile.mkdtemp(prefix='replay-sessions-')
+    for name in ('MS_USERNAME', 'MC_USERNAME'):
+        os.environ[name] = 'replay@example.com'
+    for name in ('MS_PASSWORD', 'MC_PASSWORD'):
+        os.environ[name] = 'replay'
+
+
+def print_timings(timings):
+    print(f'{"step":<24}{"count":>7}{"total s":>10}{"mean s":>10}{"max s":>10}')
+    for name, step in sorted(timings.items(), key=lambda entry: -entry[1]['total']):
+        print(f'{name:<24}{step["count"]:>7}{step["total"]:>10}{step["mean"]:>10}{step["max"]:>10}')
+
+
+def prefill_items(sheet, fraction):
+    """(vendor, stand-in cart item) for the first fraction of the sheet's lines, as if an earlier order carted them"""
+    rows = list(extract.iter_order_rows(sheet))
+    items = []
+    for _, vendor, line in rows[:int(len(rows) * fraction)]:
+        if vendor == 'MetalSupermarkets':
+            item = {'pro_sku': line.pro_sku, 'pro_length': line.pro_length, 'sel_quantity': line.sel_quantity,
+                    'page': urlsplit(line.pro_link).path}
+            if line.pro_width is not None:
+                item['pro_width'] = line.pro_width
+        else:
+            item = {'part_number': line.part_number, 'quantity': line.quantity}
+        items.append((vendor, item))
+    return items
+
+
+def run_profile(bot, profile, sheet, ms, mc, prefill=()):
+    """One full add_to_cart of sheet with the given browser profile, from logged-out fresh drivers"""
+    import session_cache
+
+    os.environ['BROWSER_PROFILE'] = profile
+    for site, account in ((ms, 'MS_USERNAME'), (mc, 'MC_USERNAME')):
+        site.reset()
+        session_cache.clear(site.vendor, os.environ[account])
+    for vendor, item in prefill:
+        (ms if vendor == 'MetalSupermarkets' else mc).add(dict(item))
+
+    start = time.perf_counter()
+    try:
+        result = bot.add_to_cart(sheet)
+    finally:
+        bot.shutdown_pools()
+    elapsed = time.perf_counter() - start
+
+    plan = result['plan']
+    result['profile'] = profile
+    result['wall_time'] = round(elapsed, 3)
+    result['assets_served'] = ms.assets_served + mc.assets_served
+    result['carted'] = {
+        'MetalSupermarkets': {'planned': plan.get('MetalSupermarkets', {}).get('carted_lines', 0), 'in_cart': len(ms.cart)},
+        'McMaster': {'planned': plan.get('McMaster', {}).get('carted_lines', 0), 'in_cart': len(mc.cart)},
+    }
+
+    print()
+    print(f'Browser profile: {profile}')
+    print_timings(result['timings'])
+    for vendor, counts in result['carted'].items():
+        print(f'{vendor}: {counts["in_cart"]} of {counts["planned"]} planned lines in the stand-in cart')
+    print(f'Page assets served: {result["assets_served"]}')
+    print(f'Wall time: {result["wall_time"]}s')
+    return result
+
+
+def print_profile_comparison(results):
+    print()
+    print(f'{"profile":<10}{"wall s":>10}{"page load s":>14}{"assets":>9}')
+    for profile, result in results.items():
+        page_load = result['timings'].get('page load', {}).get('total', 0)
+        print(f'{profile:<10}{result["wall_time"]:>10}{page_load:>14}{result["assets_served"]:>9}')
+    if {'default', 'lean'} <= results.keys() and results['default']['wall_time']:
+        saved = 1 - results['lean']['wall_time'] / results['default']['wall_time']
+        print(f'Lean profile saved {saved:.0%} of the wall time')
+
+
+def run(args):
+    catalog = {}
+    ms = StandIn('MetalSupermarkets', args.latency, args.ajax_latency, catalog, args.assets, args.asset_latency).start()
+    mc = StandIn('McMaster', args.latency, args.ajax_latency, None, args.assets, args.asset_latency).start()
+    try:
+        if args.sheet:
+            with open(args.sheet, 'r', encoding='utf-8') as f:
+                sheet = localize_sheet(f.read().splitlines(), ms.url, mc.url)
+            for _, vendor, item in extract.iter_order_rows(sheet):
+                if vendor == 'MetalSupermarkets':
+                    catalog.setdefault(urlsplit(item.pro_link).path[len('/product/'):].strip('/'), []).append(item.pro_sku)
+        else:
+            sheet, generated = synthetic_order(args.lines, ms.url, mc.url)
+            catalog.update(generated)
+
+        prefill = prefill_items(sheet, args.prefill) if args.prefill else ()
+
+        point_bot_at(ms.url, mc.url, args.engine)
+        os.environ['CART_MODE'] = args.cart_mode
+        # The stand-ins' tracker scripts are third-party hosts for the lean profile to block
+        os.environ['BROWSER_BLOCK_HOSTS'] = ','.join(site.third_party_host for site in (ms, mc))
+        import bot
+
+        profiles = ('default', 'lean') if args.profile == 'both' else (args.profile,)
+        results = {profile: run_profile(bot, profile, sheet, ms, mc, prefill) for profile in profiles}
+    finally:
+        ms.stop()
+        mc.stop()
+
+    if len(results) > 1:
+        print_profile_comparison(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results if len(results) > 1 else results[profiles[0]], f, indent=2)
+    return 0 if all(c['in_cart'] >= c['planned'] for result in results.values() for c in result['carted'].values()) else 1
+
+
+def serve(args):
+    ms = StandIn('MetalSupermarkets', args.latency, args.ajax_latency, None, args.assets, args.asset_latency).start(args.port)
+    mc = StandIn('McMaster', args.latency, args.ajax_latency, None, args.assets, args.asset_latency).start(args.port + 1 if args.port else 0)
+    print(f'MetalSupermarkets stand-in: {ms.url}')
+    print(f'McMaster stand-in: {mc.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def snapshot_name(path):
+    return (re.sub(r'[^A-Za-z0-9]+', '-', path).strip('-') or 'index') + '.html'
+
+
+def record(args):
+    """Save the logged-in page source of each url for replay"""
+    import bot
+
+    directory = os.path.join(SNAPSHOT_DIR, args.vendor)
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, 'index.json')
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    try:
+        with bot.pools[args.vendor].borrow() as (driver, wait):
+            for url in args.urls:
+                driver.get(url)
+                wait.until(bot.network_idle())
+                path = urlsplit(url).path or '/'
+                index[path] = snapshot_name(path)
+                with open(os.path.join(directory, index[path]), 'w', encoding='utf-8') as f:
+                    f.write(driver.page_source)
+                print(f'-> Recorded {url}')
+    finally:
+        bot.shutdown_pools()
+
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('run', 'serve'):
+        command = commands.add_parser(name)
+        command.add_argument('--latency', type=float, default=0.0, help='seconds added to every page load')
+        command.add_argument('--ajax-latency', type=float, default=0.0, help='seconds added to every price, cart and bulk-add call')
+        command.add_argument('--assets', type=int, default=0, help='images (plus fonts and a tracker script) on every page')
+        command.add_argument('--asset-latency', type=float, default=0.0, help='seconds added to every asset request')
+
+    run_command = commands.choices['run']
+    run_command.add_argument('--lines', type=int, default=20, help='synthetic order lines, split between vendors')
+    run_command.add_argument('--sheet', help="'||' order sheet to replay instead, links are pointed at the stand-ins")
+    run_command.add_argument('--engine', choices=('selenium', 'http'), default=os.getenv('MS_CART_ENGINE', 'selenium'))
+    run_command.add_argument('--output', help='write the run report as JSON')
+    run_command.add_argument('--profile', choices=('default', 'lean', 'both'), default=os.getenv('BROWSER_PROFILE', 'default'),
+                             help="browser profile, or 'both' to run default then lean and compare")
+    run_command.add_argument('--prefill', type=float, default=0.0, help="fraction of the order's lines already in the carts")
+    run_command.add_argument('--cart-mode', choices=('full', 'delta'), default=os.getenv('CART_MODE', 'full'),
+                             help="'delta' reads the carts first and only adds what's missing")
+    commands.choices['serve'].add_argument('--port', type=int, default=0)
+
+    record_command = commands.add_parser('record')
+    record_command.add_argument('vendor', choices=('MetalSupermarkets', 'McMaster'))
+    record_command.add_argument('urls', nargs='+')
+
+    args = parser.parse_args(argv)
+    return {'run': run, 'serve': serve, 'record': record}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import deque
+
+
+class QueueFull(Exception):
+    """The job queue for this worker class is at capacity"""
+
+
+class SchedulerClosed(Exception):
+    """The scheduler is shutting down and not accepting jobs"""
+
+
+def parse_limits(spec):
+    """'MetalSupermarkets=1,McMaster=2' -> {'MetalSupermarkets': 1, 'McMaster': 2}"""
+    limits = {}
+    for entry in (spec or '').split(','):
+        if '=' in entry:
+            vendor, limit = entry.split('=', 1)
+            limits[vendor.strip()] = int(limit)
+    return limits
+
+
+class Scheduler:
+    """Fixed worker threads per worker class, fed from bounded queues.
+
+    A job waits in its queue until every vendor it needs has a free slot, so a worker thread is
+    never tied up waiting on a busy vendor while jobs for other vendors could run.
+    """
+
+    def __init__(self, workers, queue_size=20, vendor_limits=None):
+        self.queue_size = queue_size
+        self._queues = {kind: deque() for kind in workers}
+        # Free slots per limited vendor; vendors without a limit are never waited on
+        self._vendor_slots = dict(vendor_limits or {})
+        self._running = {kind: 0 for kind in workers}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._threads = []
+
+        for kind, count in workers.items():
+            for i in range(count):
+                thread = threading.Thread(target=self._work, args=(kind,), name=f'{kind}-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, fn, *args, vendors=()):
+        """Queue fn(*args) on a worker of the given class without blocking"""
+        with self._changed:
+            if self._closed:
+                raise SchedulerClosed()
+            if len(self._queues[kind]) >= self.queue_size:
+                raise QueueFull(kind)
+            self._queues[kind].append((fn, args, set(vendors)))
+            self._changed.notify_all()
+
+    def _take(self, kind):
+        """Remove and return the oldest queued job whose vendors all have a free slot, taking the slots.
+
+        Waits until there is one; returns None once the scheduler is closed and the queue drained.
+        """
+        jobs = self._queues[kind]
+        with self._changed:
+            while True:
+                for i, job in enumerate(jobs):
+                    limited = [vendor for vendor in job[2] if vendor in self._vendor_slots]
+                    if all(self._vendor_slots[vendor] > 0 for vendor in limited):
+                        del jobs[i]
+                        for vendor in limited:
+                            self._vendor_slots[vendor] -= 1
+                        self._running[kind] += 1
+                        return job
+                if self._closed and not jobs:
+                    return None
+                self._changed.wait()
+
+    def _done(self, kind, vendors):
+        with self._changed:
+            for vendor in vendors:
+                if vendor in self._vendor_slots:
+                    self._vendor_slots[vendor] += 1
+            self._running[kind] -= 1
+            # Freed slots may let a job another worker skipped over run now
+            self._changed.notify_all()
+
+    def _work(self, kind):
+        while True:
+            job = self._take(kind)
+            if job is None:
+                return
+
+            fn, args, vendors = job
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f'-> [{kind}] Job {getattr(fn, "__name__", fn)} crashed: {e}')
+            finally:
+                self._done(kind, vendors)
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {'queued': len(self._queues[kind]), 'running': self._running[kind]}
+                for kind in self._queues
+            }
+
+    def shutdown(self):
+        """Stop taking jobs and let the workers exit once their queue is drained.
+
+        Runs from atexit, so it only flags the workers and never waits for them; being daemon
+        threads, any still running end with the process.
+        """
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+def default_vendor_limits():
+    """Concurrent jobs per vendor that its driver pool can serve without a job waiting on a driver"""
+    pool_size = max(1, int(os.getenv('DRIVER_POOL_SIZE', 1)))
+    # A MetalSupermarkets job can hold one driver per shard
+    ms_shards = max(1, min(int(os.getenv('MS_SHARDS', 1)), pool_size))
+    return {'MetalSupermarkets': max(1, pool_size // ms_shards), 'McMaster': pool_size}
+
+
+def vendor_limits_from_env():
+    """VENDOR_LIMITS, capped at what the driver pools can serve; unset vendors get that cap"""
+    limits = default_vendor_limits()
+    for vendor, limit in parse_limits(os.getenv('VENDOR_LIMITS')).items():
+        if vendor in limits and limit > limits[vendor]:
+            print(f'-> VENDOR_LIMITS {vendor}={limit} is more than its driver pool can serve, using {limits[vendor]}')
+            continue
+        limits[vendor] = limit
+    return limits
+
+
+def from_env(min_extract_workers=0):
+    return Scheduler(
+        workers={
+            'browser': int(os.getenv('BROWSER_WORKERS', 2)),
+            # At least one thread per parse process, or the processes can't all be kept busy
+            'extract': max(int(os.getenv('EXTRACT_WORKERS', 4)), min_extract_workers),
+        },
+        queue_size=int(os.getenv('JOB_QUEUE_SIZE', 20)),
+        vendor_limits=vendor_limits_from_env(),
+    )
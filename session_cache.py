@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+SESSION_CACHE_DIR = os.getenv('SESSION_CACHE_DIR', '.sessions')
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', 12 * 60 * 60))
+
+
+def _path(vendor, account):
+    key = hashlib.sha256((account or '').encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SESSION_CACHE_DIR, f'{vendor}-{key}.json')
+
+
+def save(driver, vendor, account):
+    """Save the driver's cookies and local storage for vendor/account"""
+    try:
+        state = {
+            'saved_at': time.time(),
+            'expires_at': time.time() + SESSION_CACHE_TTL,
+            'url': driver.current_url,
+            'cookies': driver.get_cookies(),
+            'local_storage': driver.execute_script('return Object.assign({}, window.localStorage);'),
+        }
+    except WebDriverException as e:
+        print(f'-> [{vendor}] Could not read session state: {e}')
+        return
+
+    os.makedirs(SESSION_CACHE_DIR, exist_ok=True)
+    path = _path(vendor, account)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+
+def load(vendor, account):
+    try:
+        with open(_path(vendor, account), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if state.get('expires_at', 0) < time.time():
+        return None
+    return state
+
+
+def clear(vendor, account):
+    try:
+        os.remove(_path(vendor, account))
+    except OSError:
+        pass
+
+
+def restore(driver, vendor, account, base_url):
+    """Load a saved session into the driver. Returns False if there is none to restore"""
+    state = load(vendor, account)
+    if not state:
+        return False
+
+    # Cookies can only be set for the domain that is currently loaded
+    driver.get(base_url)
+    now = time.time()
+    for cookie in state['cookies']:
+        if cookie.get('expiry') and cookie['expiry'] < now:
+            continue
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException:
+            continue
+
+    if state.get('local_storage'):
+        driver.execute_script(
+            'for (const [k, v] of Object.entries(arguments[0])) { window.localStorage.setItem(k, v); }',
+            state['local_storage']
+        )
+    return True
@@ -0,0 +1,82 @@
+import time
+
+import jobstore, metrics
+
+
+# Carting outcomes that are also checkpointed on the job, per order sheet line
+ITEM_OUTCOMES = {'item_added': 'added', 'item_in_cart': 'added', 'item_failed': 'failed'}
+
+
+def job_progress(jobs, job_id: str):
+    """Progress callback that appends events to the job and checkpoints item outcomes"""
+    def progress(kind, **data):
+        jobs.append_event(job_id, {'type': kind, **data})
+        if kind in ITEM_OUTCOMES and data.get('rows'):
+            outcome = {
+                'vendor': data['vendor'],
+                'part_number': data['part_number'],
+                'status': ITEM_OUTCOMES[kind],
+                'attempts': data.get('attempts'),
+                'error': data.get('error'),
+            }
+            jobs.checkpoint(job_id, {str(row): outcome for row in data['rows']})
+    return progress
+
+
+def carted_rows(job):
+    """Order sheet line numbers an add_to_cart job has checkpointed as added"""
+    return {int(row) for row, item in (job.get('items') or {}).items() if item.get('status') == 'added'}
+
+
+def finish_job(jobs, job_id: str, job_type: str, start: float, status: str, **fields):
+    """Record the outcome on the job and its run time in the job duration histogram"""
+    metrics.job_seconds.observe(time.perf_counter() - start, type=job_type, status=status)
+    if status == "failed":
+        metrics.failures.inc(cause=f"job_{job_type}")
+    jobs.update(job_id, status, **fields)
+
+
+def run_add_to_cart(job_id: str):
+    """Run bot.add_to_cart over the job's stored order sheet and record the outcome on the job.
+
+    A resumed job runs again here, skipping the lines its checkpoint already has as added.
+    """
+    # Imported on first use so the web process can start without Selenium
+    import bot
+    jobs = jobstore.get_store()
+    start = time.perf_counter()
+    try:
+        done = carted_rows(jobs.get(job_id))
+        jobs.update(job_id, "processing")
+        result = bot.add_to_cart(jobs.sheet(job_id), job_progress(jobs, job_id), carted_rows=done)
+        finish_job(jobs, job_id, "add_to_cart", start, "completed", result=result)
+    except Exception as e:
+        finish_job(jobs, job_id, "add_to_cart", start, "failed", error=str(e))
+
+
+def run_extract(job_id: str, vendor: str, filename: str, html_content, name: str, subteam: str):
+    """Parse a saved cart page, submit its parts and record the outcome on the job.
+
+    html_content is the page's bytes, or an extract.SpooledUpload that is removed once parsed.
+    """
+    import extract
+    jobs = jobstore.get_store()
+    start = time.perf_counter()
+    try:
+        jobs.update(job_id, "processing")
+
+        progress = job_progress(jobs, job_id)
+        if vendor == "MetalSupermarkets":
+            result, submissions = extract.metal_supermarkets(html_content, name, subteam, progress)
+        elif vendor == "McMaster":
+            result, submissions = extract.mcmaster(html_content, name, subteam, progress)
+        else:
+            raise ValueError(f"Unsupported vendor: {vendor}")
+
+        # The frontend reads results as lists of [key, value] pairs
+        finish_job(jobs, job_id, "extract", start, "completed", result=result.to_pairs(), submissions=submissions)
+    except Exception as e:
+        finish_job(jobs, job_id, "extract", start, "failed", error=str(e))
+    finally:
+        if isinstance(html_content, extract.SpooledUpload):
+            html_content.remove()
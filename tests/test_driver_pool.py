@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_pool import DriverPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.session_valid = True
+        self.logins = 0
+        self.quit_called = False
+
+    def execute_script(self, script):
+        return 'complete'
+
+    def quit(self):
+        self.quit_called = True
+
+
+class IdleLoginCheckTest(unittest.TestCase):
+    """A driver borrowed after sitting idle has its login checked, and redone if the session expired"""
+
+    def make_pool(self, login=None, idle_check=0.1):
+        self.drivers = []
+        self.checks = 0
+
+        def create():
+            driver = FakeDriver()
+            self.drivers.append(driver)
+            return driver, None
+
+        def default_login(driver, wait):
+            driver.logins += 1
+            driver.session_valid = True
+
+        def logged_in(driver):
+            self.checks += 1
+            return driver.session_valid
+
+        return DriverPool('McMaster', create, login or default_login, size=1, logged_in=logged_in, idle_check=idle_check)
+
+    def borrow_once(self, pool):
+        with pool.borrow() as (driver, _):
+            return driver
+
+    def test_recently_used_driver_is_not_checked(self):
+        pool = self.make_pool(idle_check=60)
+        driver = self.borrow_once(pool)
+        self.assertIs(self.borrow_once(pool), driver)
+        self.assertEqual((self.checks, driver.logins), (0, 1))
+
+    def test_idle_driver_with_a_live_session_is_reused(self):
+        pool = self.make_pool()
+        driver = self.borrow_once(pool)
+        time.sleep(0.15)
+        self.assertIs(self.borrow_once(pool), driver)
+        self.assertEqual((self.checks, driver.logins), (1, 1))
+
+    def test_idle_driver_with_an_expired_session_logs_in_again(self):
+        pool = self.make_pool()
+        driver = self.borrow_once(pool)
+        driver.session_valid = False
+        time.sleep(0.15)
+        self.assertIs(self.borrow_once(pool), driver)
+        self.assertEqual((self.checks, driver.logins), (1, 2))
+        self.assertFalse(driver.quit_called)
+
+    def test_driver_that_cant_log_in_again_is_replaced(self):
+        def login(driver, wait):
+            if self.drivers.index(driver) > 0 or not driver.logins:
+                driver.logins += 1
+                return
+            raise RuntimeError('login form did not load')
+
+        pool = self.make_pool(login=login)
+        first = self.borrow_once(pool)
+        first.session_valid = False
+        time.sleep(0.15)
+        second = self.borrow_once(pool)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.quit_called)
+        self.assertEqual(pool.live, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
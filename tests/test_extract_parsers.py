@@ -0,0 +1,54 @@
+import glob
+import io
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bench
+import extract
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures', 'carts')
+# Fixture file prefix -> (vendor, bs4 parser, lxml parser)
+PARSERS = {
+    'ms': ('MetalSupermarkets', extract.html_ms_bs4, extract.html_ms_lxml),
+    'mc': ('McMaster', extract.html_mc_bs4, extract.html_mc_lxml),
+}
+
+
+class ParserEquivalenceTest(unittest.TestCase):
+    """The lxml and streaming parsers must give the same lines as the original bs4 ones"""
+
+    def assert_equivalent(self, prefix, content):
+        vendor, bs4_parser, lxml_parser = PARSERS[prefix]
+        expected = bs4_parser(content).to_pairs()
+        self.assertEqual(lxml_parser(content).to_pairs(), expected)
+        self.assertEqual([line.to_pairs() for line in extract.iter_cart_items(vendor, io.BytesIO(content))], expected)
+
+    def test_fixture_carts(self):
+        paths = sorted(glob.glob(os.path.join(FIXTURES, '*.html')))
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(fixture=os.path.basename(path)):
+                with open(path, 'rb') as f:
+                    self.assert_equivalent(os.path.basename(path)[:2], f.read())
+
+    def test_empty_upload_is_an_empty_cart(self):
+        for prefix, (vendor, _, _) in PARSERS.items():
+            with self.subTest(vendor=vendor):
+                self.assertEqual(len(extract.parse_cart(vendor, b'')), 0)
+                upload = extract.SpooledUpload.from_stream(vendor, io.BytesIO(b''))
+                self.addCleanup(upload.remove)
+                self.assertEqual(len(extract.parse_cart(vendor, upload)), 0)
+
+    def test_synthetic_carts(self):
+        for lines in (1, 50, 500):
+            with self.subTest(lines=lines):
+                self.assert_equivalent('ms', bench.synthetic_ms_cart(lines).encode('utf-8'))
+                self.assert_equivalent('mc', bench.synthetic_mc_cart(lines).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobstore
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class JobStoreTests:
+    """Behaviour every job store backend must share; subclasses provide make_store"""
+
+    def make_store(self, **kwargs):
+        raise NotImplementedError
+
+    def evict(self, store):
+        store.evict()
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def create(self, store=None, job_type='add_to_cart', status='pending'):
+        # created_at orders jobs, so keep creations apart
+        time.sleep(0.002)
+        return (store or self.store).create(job_type, status)
+
+    def test_create_update_get(self):
+        job_id = self.create()
+        job = self.store.get(job_id)
+        self.assertEqual((job['id'], job['type'], job['status'], job['error'], job['result']), (job_id, 'add_to_cart', 'pending', None, None))
+
+        self.store.update(job_id, 'failed', error='boom')
+        self.store.update(job_id, result={'ok': True}, resumes=2)
+        job = self.store.get(job_id)
+        self.assertEqual((job['status'], job['error'], job['result'], job['resumes']), ('failed', 'boom', {'ok': True}, 2))
+        self.assertIsNone(self.store.get('missing'))
+        self.store.update('missing', 'failed')
+
+    def test_events(self):
+        job_id = self.create()
+        self.store.append_event(job_id, {'type': 'item_added', 'part_number': 'A'})
+        self.store.update(job_id, 'completed')
+        events = self.store.events(job_id)
+        self.assertEqual([(event['seq'], event['type']) for event in events], [(1, 'item_added'), (2, 'status')])
+        self.assertEqual(events[1]['status'], 'completed')
+        self.assertEqual([event['seq'] for event in self.store.events(job_id, 1)], [2])
+        self.assertEqual(self.store.wait_events(job_id, 2, timeout=0.05), [])
+        self.store.append_event('missing', {'type': 'item_added'})
+        self.assertEqual(self.store.events('missing'), [])
+
+    def test_list_filters(self):
+        first = self.create(job_type='add_to_cart')
+        second = self.create(job_type='extract')
+        third = self.create(job_type='extract')
+        self.store.update(second, 'completed')
+
+        self.assertEqual([job['id'] for job in self.store.list()], [third, second, first])
+        self.assertEqual([job['id'] for job in self.store.list(status='pending')], [third, first])
+        self.assertEqual([job['id'] for job in self.store.list(job_type='extract')], [third, second])
+        self.assertEqual([job['id'] for job in self.store.list(status='pending', job_type='extract')], [third])
+        self.assertEqual([job['id'] for job in self.store.list(limit=1, offset=1)], [second])
+        self.assertEqual(set(self.store.list()[0]), set(jobstore.META_FIELDS))
+
+    def test_checkpoint(self):
+        job_id = self.create()
+        self.store.checkpoint(job_id, {'1': {'status': 'failed'}, '2': {'status': 'added'}})
+        self.store.checkpoint(job_id, {'1': {'status': 'added', 'attempts': 2}})
+        self.assertEqual(self.store.get(job_id)['items'], {'1': {'status': 'added', 'attempts': 2}, '2': {'status': 'added'}})
+        self.store.checkpoint('missing', {'1': {'status': 'added'}})
+        self.assertIsNone(self.store.get('missing'))
+
+    def test_sheet_pages(self):
+        job_id = self.create()
+        lines = [f'line {i}' if i % 7 else '' for i in range(jobstore.SHEET_PAGE_SIZE * 2 + 3)]
+        self.store.save_sheet(job_id, iter(lines))
+        self.assertEqual(list(self.store.sheet(job_id)), lines)
+        self.assertEqual(list(self.store.sheet(self.create())), [])
+
+    def test_resume(self):
+        job_id = self.create()
+        self.assertFalse(self.store.resume(job_id))
+        self.store.update(job_id, 'processing')
+        self.assertFalse(self.store.resume(job_id))
+        self.store.update(job_id, 'failed', error='boom')
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.store.resume(job_id))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+        job = self.store.get(job_id)
+        self.assertEqual((job['status'], job['error'], job['resumes']), ('pending', None, 1))
+        self.assertEqual([job['id'] for job in self.store.list(status='pending')], [job_id])
+        self.assertEqual(self.store.list(status='failed'), [])
+        self.assertEqual(self.store.events(job_id)[-1]['status'], 'pending')
+
+    def test_resume_orphaned_job(self):
+        store = self.make_store(stale_after=0.2)
+        running = self.create(store)
+        store.update(running, 'processing')
+        # Still being worked on
+        self.assertFalse(store.resume(running))
+        self.assertFalse(jobstore.resumable(store.get(running), store.stale_after))
+
+        # Left processing and pending by a process that died
+        orphans = [running, self.create(store)]
+        time.sleep(0.3)
+        for job_id in orphans:
+            self.assertTrue(jobstore.resumable(store.get(job_id), store.stale_after))
+            self.assertTrue(store.resume(job_id))
+            # Fresh again, so a second resume waits for this run
+            self.assertFalse(store.resume(job_id))
+        self.assertEqual([job['resumes'] for job in map(store.get, orphans)], [1, 1])
+        self.assertEqual(store.list(status='processing'), [])
+
+    def test_reserve_key(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.store.reserve_key('add:abc'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+        self.assertIsNone(self.store.key_response('add:abc'))
+
+        self.store.save_key_response('add:abc', {'job_id': 'first'})
+        self.assertFalse(self.store.reserve_key('add:abc'))
+        self.assertEqual(self.store.key_response('add:abc'), {'job_id': 'first'})
+        # Only a key still waiting on its response can be released
+        self.store.release_key('add:abc')
+        self.assertEqual(self.store.key_response('add:abc'), {'job_id': 'first'})
+
+        self.assertTrue(self.store.reserve_key('add:retry'))
+        self.store.release_key('add:retry')
+        self.assertTrue(self.store.reserve_key('add:retry'))
+
+    def test_reserved_key_expires_with_its_lease(self):
+        store = self.make_store(key_lease=0.2)
+        self.assertTrue(store.reserve_key('request:abc'))
+        self.assertFalse(store.reserve_key('request:abc'))
+        time.sleep(0.3)
+        self.assertTrue(store.reserve_key('request:abc'))
+
+    def test_extraction_and_sent_parts(self):
+        self.assertIsNone(self.store.extraction('McMaster:abc'))
+        self.store.save_extraction('McMaster:abc', {'part_number': ['91251A540']})
+        self.assertEqual(self.store.extraction('McMaster:abc'), {'part_number': ['91251A540']})
+
+        self.assertEqual(self.store.claim_parts('McMaster:abc', ['0:a', '1:b']), {'0:a', '1:b'})
+        self.assertEqual(self.store.claim_parts('McMaster:abc', ['0:a', '1:b', '2:c']), {'2:c'})
+        self.store.release_parts('McMaster:abc', ['1:b'])
+        self.assertEqual(self.store.claim_parts('McMaster:abc', ['0:a', '1:b']), {'1:b'})
+        self.assertEqual(self.store.claim_parts('McMaster:other', ['0:a']), {'0:a'})
+
+    def test_size_eviction_keeps_unfinished_jobs(self):
+        store = self.make_store(max_count=2)
+        running = self.create(store)
+        store.update(running, 'processing')
+        pending = self.create(store)
+        done = self.create(store)
+        store.update(done, 'completed')
+        newest = self.create(store)
+        self.evict(store)
+        for job_id in (running, pending, done, newest):
+            self.assertIsNotNone(store.get(job_id))
+
+        store.update(running, 'completed')
+        self.evict(store)
+        self.assertIsNone(store.get(running))
+        self.assertIsNotNone(store.get(pending))
+
+    def test_ttl_eviction_keeps_unfinished_jobs(self):
+        store = self.make_store(ttl=0)
+        pending = self.create(store)
+        done = self.create(store)
+        store.checkpoint(done, {'1': {'status': 'added'}})
+        store.save_sheet(done, ['a'])
+        store.update(done, 'failed')
+        time.sleep(0.01)
+        self.evict(store)
+        self.assertIsNotNone(store.get(pending))
+        self.assertIsNone(store.get(done))
+        self.assertEqual(list(store.sheet(done)), [])
+
+
+class MemoryJobStoreTest(JobStoreTests, unittest.TestCase):
+
+    def make_store(self, **kwargs):
+        return jobstore.MemoryJobStore(**kwargs)
+
+    def evict(self, store):
+        with store._lock:
+            store._evict()
+
+
+class SqliteJobStoreTest(JobStoreTests, unittest.TestCase):
+
+    def make_store(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return jobstore.SqliteJobStore(os.path.join(directory.name, 'jobs.db'), **kwargs)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisJobStoreTest(JobStoreTests, unittest.TestCase):
+
+    def make_store(self, **kwargs):
+        return jobstore.RedisJobStore(fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True), **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+
+class FakeLink:
+    def __init__(self, text):
+        self.text = text
+
+    def is_displayed(self):
+        return True
+
+
+class FakeDriver:
+    """A McMaster page whose header only renders after a few looks"""
+
+    def __init__(self, header, render_after=3):
+        self.header = header
+        self.render_after = render_after
+        self.looks = 0
+
+    def find_elements(self, by, value):
+        self.looks += 1
+        if self.looks <= self.render_after * 2:
+            return []
+        return [link for locator, link in self.header if (by, value) == locator]
+
+
+class McLoggedInTest(unittest.TestCase):
+    def test_waits_for_the_header_before_deciding(self):
+        driver = FakeDriver([(bot.MC_LOGIN_LINK, FakeLink('Log in'))])
+        self.assertFalse(bot.mc_logged_in(driver))
+        self.assertGreater(driver.looks, 6)
+
+    def test_log_out_link_means_logged_in(self):
+        driver = FakeDriver([(bot.MC_LOGOUT_LINK, FakeLink('Log out'))])
+        self.assertTrue(bot.mc_logged_in(driver))
+
+    def test_header_that_never_renders_is_not_logged_in(self):
+        driver = FakeDriver([], render_after=0)
+        with mock.patch.object(bot, 'MC_LOGIN_CHECK_TIMEOUT', 0.2):
+            self.assertFalse(bot.mc_logged_in(driver))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import socket
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import ms_http
+import replay
+from cart import MsLine
+
+
+class AddItemsTest(unittest.TestCase):
+    """ms_http.add_items against replay's MetalSupermarkets stand-in"""
+
+    def setUp(self):
+        self.site = replay.StandIn('MetalSupermarkets', catalog={'flat-bar': ['MS000001', 'MS000002']}).start()
+        self.addCleanup(self.site.stop)
+        self.link = f'{self.site.url}/product/flat-bar'
+        self.endpoint = f'{self.site.url}/wp-admin/admin-ajax.php'
+        self.lines = [
+            MsLine(pro_sku='MS000001', sel_quantity='2', pro_length='12', pro_link=self.link),
+            MsLine(pro_sku='MS000002', sel_quantity='1', pro_length='24', pro_width='2', pro_link=self.link),
+        ]
+
+    def session(self, logged_in=True):
+        cookies = [{'name': replay.SESSION_COOKIE, 'value': '1'}] if logged_in else []
+        return ms_http.make_session(cookies, workers=1)
+
+    def test_adds_every_line(self):
+        self.assertEqual(ms_http.add_items(self.session(), self.lines, endpoint=self.endpoint), ([], []))
+        self.assertEqual([(item['pro_sku'], item['sel_quantity']) for item in self.site.cart], [('MS000001', '2'), ('MS000002', '1')])
+
+    def test_admin_ajax_zero_is_a_failure(self):
+        # Logged out, admin-ajax answers 0
+        unsent, unconfirmed = ms_http.add_items(self.session(logged_in=False), self.lines, endpoint=self.endpoint)
+        self.assertEqual((unsent, unconfirmed), ([], self.lines))
+        self.assertEqual(self.site.cart, [])
+
+    def test_html_page_is_a_failure(self):
+        # A POST to /login redirects to the account page, which comes back as a 200 HTML page
+        unsent, unconfirmed = ms_http.add_items(self.session(), self.lines, endpoint=f'{self.site.url}/login')
+        self.assertEqual((unsent, unconfirmed), ([], self.lines))
+
+    def test_unknown_row_was_never_sent(self):
+        missing = MsLine(pro_sku='MS999999', sel_quantity='1', pro_length='12', pro_link=self.link)
+        self.assertEqual(ms_http.add_items(self.session(), [missing], endpoint=self.endpoint), ([missing], []))
+
+    def test_refused_connection_was_never_sent(self):
+        with socket.socket() as closed:
+            closed.bind(('127.0.0.1', 0))
+            port = closed.getsockname()[1]
+        unsent, unconfirmed = ms_http.add_items(self.session(), self.lines, endpoint=f'http://127.0.0.1:{port}/wp-admin/admin-ajax.php')
+        self.assertEqual((unsent, unconfirmed), (self.lines, []))
+
+    def test_read_timeout_after_send_is_unconfirmed(self):
+        session = self.session()
+        with mock.patch.object(session, 'post', side_effect=requests.ReadTimeout('timed out')):
+            unsent, unconfirmed = ms_http.add_items(session, self.lines, endpoint=self.endpoint)
+        self.assertEqual((unsent, unconfirmed), ([], self.lines))
+
+    def test_server_error_is_unconfirmed(self):
+        session = self.session()
+        response = requests.Response()
+        response.status_code = 502
+        with mock.patch.object(session, 'post', return_value=response):
+            unsent, unconfirmed = ms_http.add_items(session, self.lines, endpoint=self.endpoint)
+        self.assertEqual((unsent, unconfirmed), ([], self.lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extract
+
+
+def ms_row(dimensions='36 X 2', quantity='2', part_number='MS000101', link='https://www.metalsupermarkets.com/product/flat-bar'):
+    return f'FALSE||TRUE||Sam||Frame||MetalSupermarkets||{part_number}||Flat bar||10.00||{quantity}||{dimensions}||{link}'
+
+
+def mc_row(attribute='', quantity='5', part_number='91251A540'):
+    return f'FALSE||TRUE||Sam||Frame||McMaster||{part_number}||Screw||0.31||{quantity}||{attribute}||https://www.mcmaster.com/{part_number}'
+
+
+def parse(lines):
+    errors, skipped = [], []
+    rows = list(extract.iter_order_rows(lines, errors=errors, skipped=skipped))
+    return rows, errors, skipped
+
+
+class IterOrderRowsTest(unittest.TestCase):
+
+    def test_ms_row(self):
+        rows, errors, _ = parse([ms_row()])
+        self.assertEqual(errors, [])
+        [(line, vendor, item)] = rows
+        self.assertEqual((line, vendor), (1, 'MetalSupermarkets'))
+        self.assertEqual((item.pro_sku, item.sel_quantity, item.pro_length, item.pro_width, item.rows), ('MS000101', '2', '36', '2', (1,)))
+
+    def test_mc_row(self):
+        [(_, vendor, item)] = parse([mc_row('Length: 1"')])[0]
+        self.assertEqual(vendor, 'McMaster')
+        self.assertEqual((item.part_number, item.quantity, item.extra_attr), ('91251A540', '5', 'Length: 1"'))
+        [(_, _, item)] = parse([mc_row()])[0]
+        self.assertIsNone(item.extra_attr)
+
+    def test_dimensions(self):
+        for dimensions, expected in (('36', ('36', None)), ('12 x 2', ('12', '2')), ('12X2.5', ('12', '2.5')), (' 48.25 X .5 ', ('48.25', '.5'))):
+            with self.subTest(dimensions=dimensions):
+                rows, errors, _ = parse([ms_row(dimensions)])
+                self.assertEqual(errors, [])
+                self.assertEqual((rows[0][2].pro_length, rows[0][2].pro_width), expected)
+
+    def test_bad_dimensions(self):
+        for dimensions in ('', 'abc1', '12 X two', '12 X 2 X 3', '1/2', '12in'):
+            with self.subTest(dimensions=dimensions):
+                rows, errors, _ = parse([ms_row(dimensions)])
+                self.assertEqual(rows, [])
+                self.assertEqual([(error['line'], error['vendor']) for error in errors], [(1, 'MetalSupermarkets')])
+
+    def test_bad_quantity(self):
+        for quantity in ('0', '-1', '1.5', 'two', ''):
+            with self.subTest(quantity=quantity):
+                rows, errors, _ = parse([mc_row(quantity=quantity)])
+                self.assertEqual(rows, [])
+                self.assertIn('quantity', errors[0]['error'])
+
+    def test_missing_fields(self):
+        rows, errors, _ = parse(['FALSE||TRUE||Sam||Frame||McMaster||91251A540', ms_row(link=''), ms_row(part_number='')])
+        self.assertEqual(rows, [])
+        self.assertEqual([error['line'] for error in errors], [1, 2, 3])
+        self.assertEqual(errors[0]['error'], f'expected {len(extract.ORDER_HEADER)} fields, got 6')
+
+    def test_line_numbers_count_blank_and_skipped_lines(self):
+        other = ms_row().replace('MetalSupermarkets', 'Amazon')
+        rows, errors, skipped = parse([ms_row(), '', '   ', other, 'bad', mc_row()])
+        self.assertEqual([(line, vendor) for line, vendor, _ in rows], [(1, 'MetalSupermarkets'), (6, 'McMaster')])
+        self.assertEqual(skipped, [{'line': 4, 'vendor': 'Amazon'}])
+        self.assertEqual([error['line'] for error in errors], [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import planner
+from cart import CartBatch, McLine, MsLine
+
+LINK = 'https://www.metalsupermarkets.com/product/flat-bar'
+
+
+def ms(sku, quantity, length='36', width=None, link=LINK, rows=None):
+    return MsLine(pro_sku=sku, sel_quantity=str(quantity), pro_length=length, pro_width=width, pro_link=link, rows=rows)
+
+
+def mc(part_number, quantity, extra_attr=None, rows=None):
+    return McLine(part_number, str(quantity), extra_attr, rows=rows)
+
+
+class MergeLinesTest(unittest.TestCase):
+
+    def test_sums_the_same_cut_and_keeps_every_row(self):
+        lines, merges = planner.merge_lines('MetalSupermarkets', [ms('A', 1, rows=(1,)), ms('B', 1, rows=(2,)), ms('A', 2, rows=(3,))])
+        self.assertIsInstance(lines, CartBatch)
+        self.assertEqual([(line.pro_sku, line.sel_quantity, line.rows) for line in lines], [('A', '3', (1, 3)), ('B', '1', (2,))])
+        self.assertEqual(merges, [{'part_number': 'A', 'lines': 2, 'quantity': '3'}])
+
+    def test_different_cuts_stay_separate(self):
+        data = [ms('A', 1, length='36'), ms('A', 1, length='24'), ms('A', 1, length='36', width='2'), ms('A', 1, link=LINK + '-2')]
+        lines, merges = planner.merge_lines('MetalSupermarkets', data)
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(merges, [])
+
+    def test_mcmaster_merges_by_part_and_attribute(self):
+        data = [mc('91251A540', 5), mc('91251A540', 5, 'Length: 1"'), mc('91251A540', 10)]
+        lines, _ = planner.merge_lines('McMaster', data)
+        self.assertEqual([(line.quantity, line.extra_attr) for line in lines], [('15', None), ('5', 'Length: 1"')])
+
+
+class CartKeyTest(unittest.TestCase):
+
+    def test_ms_dimensions_compare_as_numbers(self):
+        self.assertEqual(planner.cart_key(ms(' a1 ', 1, length='16')), planner.cart_key(ms('A1', 1, length='16.0 ')))
+        self.assertNotEqual(planner.cart_key(ms('A1', 1, length='16')), planner.cart_key(ms('A1', 1, length='16', width='2')))
+
+    def test_mcmaster_ignores_case_and_attribute(self):
+        self.assertEqual(planner.cart_key(mc('91251a540 ', 1)), planner.cart_key(mc('91251A540', 1, 'Length: 1"')))
+
+    def test_cart_quantities_skip_unreadable_quantities(self):
+        quantities = planner.cart_quantities([mc('1', 2), mc('1', 3), McLine('2', ''), McLine('3', 'n/a')])
+        self.assertEqual(quantities, Counter({'1': 5}))
+
+
+class SubtractCartTest(unittest.TestCase):
+
+    def test_covered_topped_up_and_missing(self):
+        in_cart = Counter({'A': 5, 'B': 1})
+        lines = [mc('A', 5, rows=(1,)), mc('B', 3, rows=(2,)), mc('C', 2, rows=(3,))]
+        to_add, covered, cut = planner.subtract_cart('McMaster', lines, in_cart)
+        self.assertEqual([(line.part_number, line.quantity) for line in to_add], [('B', '2'), ('C', '2')])
+        self.assertEqual(covered, [lines[0]])
+        self.assertEqual(cut, 1)
+        self.assertEqual(+in_cart, Counter())
+
+    def test_cart_quantity_is_used_up_across_lines(self):
+        # Two cuts with the same cart key share the 3 already in the cart
+        in_cart = Counter({planner.cart_key(ms('A', 1)): 3})
+        lines = [ms('A', 2, rows=(1,)), ms('A', 2, link=LINK + '-2', rows=(2,))]
+        to_add, covered, cut = planner.subtract_cart('MetalSupermarkets', lines, in_cart)
+        self.assertEqual(covered, [lines[0]])
+        self.assertEqual([(line.sel_quantity, line.rows) for line in to_add], [('1', (2,))])
+        self.assertEqual(cut, 1)
+
+    def test_plan_reports_what_it_did(self):
+        in_cart = Counter({'A': 1})
+        lines, report, covered = planner.plan('McMaster', [mc('A', 1), mc('A', 1), mc('B', 1)], None, in_cart)
+        self.assertEqual([(line.part_number, line.quantity) for line in lines], [('A', '1'), ('B', '1')])
+        self.assertEqual(covered, [])
+        self.assertEqual(report['lines'], 3)
+        self.assertEqual(report['carted_lines'], 2)
+        self.assertEqual(report['topped_up_lines'], 1)
+        self.assertEqual(report['in_cart_lines'], 0)
+
+    def test_plan_counts_page_loads(self):
+        _, report, _ = planner.plan('MetalSupermarkets', [ms('A', 1), ms('B', 1), ms('C', 1, link=LINK + '-2')])
+        self.assertEqual(report['page_loads'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
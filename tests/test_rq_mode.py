@@ -0,0 +1,116 @@
+import io
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bench
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures', 'carts')
+# Modules that read WORKER_MODE, JOB_STORE or REDIS_URL at import, loaded fresh for rq mode
+RQ_MODULES = ('jobstore', 'tasks', 'worker', 'main')
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RqModeTest(unittest.TestCase):
+    """/request through an inline rq queue on fakeredis, read back from the Redis job store"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.form = bench.start_fake_form()
+        cls.env = mock.patch.dict(os.environ, {
+            'WORKER_MODE': 'rq',
+            'JOB_STORE': 'redis',
+            'REDIS_URL': 'fakeredis://',
+            'RQ_ASYNC': '0',
+            'SUBMIT_FORM_LINK': f'http://127.0.0.1:{cls.form.server_port}/form?part={{part_number}}&qty={{quantity}}',
+        })
+        cls.env.start()
+        cls.saved_modules = {name: sys.modules.pop(name) for name in RQ_MODULES if name in sys.modules}
+        import main
+        cls.main = main
+        cls.client = main.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        for name in RQ_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(cls.saved_modules)
+        cls.env.stop()
+        cls.form.shutdown()
+
+    def setUp(self):
+        self.extract_jobs = len(self.main.jobs.list(job_type='extract_McMaster', limit=500))
+
+    def upload(self, fixture, vendor, headers=None):
+        with open(os.path.join(FIXTURES, fixture), 'rb') as f:
+            content = f.read()
+        return self.client.post('/request', headers=headers, data={
+            'vendor': vendor,
+            'name': 'Test',
+            'subteam': 'Suspension',
+            'file': (io.BytesIO(content), fixture, 'text/html'),
+        }, content_type='multipart/form-data')
+
+    def test_uses_the_redis_store(self):
+        import jobstore
+        self.assertEqual(self.main.WORKER_MODE, 'rq')
+        self.assertIsInstance(self.main.jobs, jobstore.RedisJobStore)
+
+    def test_enqueued_job_runs_and_reports_its_status(self):
+        response = self.upload('mc_basic.html', 'McMaster')
+        self.assertEqual(response.status_code, 200)
+        jobs = response.get_json()['jobs']
+        self.assertEqual(len(jobs), 1)
+        job_id = jobs[0]['job_id']
+
+        # Ran inline at enqueue, so nothing is left waiting for a worker
+        self.assertEqual(self.main.job_queues['extract'].count, 0)
+
+        job = self.client.get(f'/job/{job_id}').get_json()
+        self.assertEqual(job['status'], 'completed')
+        self.assertTrue(job['result'])
+        self.assertTrue(all(part['ok'] for part in job['submissions']['parts']))
+
+        events = self.client.get(f'/job/{job_id}/events?wait=0').get_json()
+        self.assertTrue(events['done'])
+
+    def test_duplicate_idempotency_key_gets_the_first_job(self):
+        responses = []
+
+        def upload():
+            responses.append(self.upload('mc_edge.html', 'McMaster', headers={'Idempotency-Key': 'edge-upload'}))
+
+        threads = [threading.Thread(target=upload) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+        job_ids = {job['job_id'] for response in responses for job in response.get_json()['jobs']}
+        self.assertEqual(len(job_ids), 1)
+        self.assertEqual(len(self.main.jobs.list(job_type='extract_McMaster', limit=500)), self.extract_jobs + 1)
+
+    def test_reupload_skips_parts_already_sent(self):
+        first = self.client.get(f"/job/{self.upload('ms_basic.html', 'MetalSupermarkets').get_json()['jobs'][0]['job_id']}").get_json()
+        again = self.client.get(f"/job/{self.upload('ms_basic.html', 'MetalSupermarkets').get_json()['jobs'][0]['job_id']}").get_json()
+        self.assertEqual(first['submissions']['skipped'], 0)
+        self.assertEqual(again['submissions']['submitted'], 0)
+        self.assertEqual(again['submissions']['skipped'], len(first['submissions']['parts']))
+
+    def test_unknown_job_is_not_found(self):
+        self.assertEqual(self.client.get('/job/missing').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
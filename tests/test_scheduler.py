@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler
+
+
+class VendorSlotTest(unittest.TestCase):
+    """Jobs for a vendor at its limit wait in the queue, not on a worker thread"""
+
+    def setUp(self):
+        self.scheduler = scheduler.Scheduler({'browser': 2}, queue_size=5, vendor_limits={'MetalSupermarkets': 1})
+        self.addCleanup(self.scheduler.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = []
+        self.finished = {}
+
+    def job(self, name, hold=False):
+        self.finished[name] = threading.Event()
+
+        def run():
+            self.started.append(name)
+            if hold:
+                self.release.wait(5)
+            self.finished[name].set()
+        run.__name__ = name
+        return run
+
+    def wait_for_start(self, name):
+        deadline = time.monotonic() + 2
+        while name not in self.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn(name, self.started)
+
+    def test_busy_vendor_does_not_hold_a_worker(self):
+        self.scheduler.submit('browser', self.job('ms-1', hold=True), vendors={'MetalSupermarkets'})
+        self.wait_for_start('ms-1')
+        self.scheduler.submit('browser', self.job('ms-2'), vendors={'MetalSupermarkets'})
+        self.scheduler.submit('browser', self.job('mc'), vendors={'McMaster'})
+
+        # The second worker skips ms-2, whose vendor is full, and runs the McMaster job
+        self.assertTrue(self.finished['mc'].wait(2))
+        self.assertFalse(self.finished['ms-2'].is_set())
+        self.assertEqual(self.scheduler.stats()['browser']['queued'], 1)
+
+        self.release.set()
+        self.assertTrue(self.finished['ms-2'].wait(2))
+        self.assertEqual(self.started, ['ms-1', 'mc', 'ms-2'])
+
+    def test_queue_limit_counts_waiting_jobs(self):
+        self.scheduler.submit('browser', self.job('ms-0', hold=True), vendors={'MetalSupermarkets'})
+        self.wait_for_start('ms-0')
+        for i in range(1, 6):
+            self.scheduler.submit('browser', self.job(f'ms-{i}'), vendors={'MetalSupermarkets'})
+        self.assertEqual(self.scheduler.stats()['browser'], {'queued': 5, 'running': 1})
+        with self.assertRaises(scheduler.QueueFull):
+            self.scheduler.submit('browser', self.job('ms-6'), vendors={'MetalSupermarkets'})
+
+    def test_shutdown_drains_the_queue(self):
+        self.scheduler.submit('browser', self.job('ms-1', hold=True), vendors={'MetalSupermarkets'})
+        self.scheduler.submit('browser', self.job('ms-2'), vendors={'MetalSupermarkets'})
+        self.scheduler.shutdown()
+        with self.assertRaises(scheduler.SchedulerClosed):
+            self.scheduler.submit('browser', self.job('late'))
+
+        self.release.set()
+        self.assertTrue(self.finished['ms-2'].wait(2))
+        for thread in self.scheduler._threads:
+            thread.join(2)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
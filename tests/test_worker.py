@@ -0,0 +1,24 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import worker
+
+
+class WorkerMetricsTest(unittest.TestCase):
+    def test_browser_worker_reports_live_sessions(self):
+        worker.register_gauges(['browser'])
+        import bot
+        self.addCleanup(setattr, bot.pools['McMaster'], '_live', bot.pools['McMaster']._live)
+        bot.pools['McMaster']._live = 1
+
+        rendered = metrics.render()
+        self.assertIn('browser_sessions_live{vendor="McMaster"} 1', rendered)
+        self.assertIn('browser_sessions_live{vendor="MetalSupermarkets"} 0', rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+import metrics
+
+
+class AdaptiveWait(WebDriverWait):
+    """WebDriverWait that polls quickly at first and backs off to poll_frequency"""
+
+    def __init__(self, driver, timeout, poll_frequency=0.5, ignored_exceptions=None, initial_poll=0.05):
+        super().__init__(driver, timeout, poll_frequency, ignored_exceptions)
+        self._initial_poll = initial_poll
+
+    def until(self, method, message=''):
+        screen = None
+        stacktrace = None
+        poll = self._initial_poll
+        end_time = time.monotonic() + self._timeout
+        while True:
+            try:
+                value = method(self._driver)
+                if value:
+                    return value
+            except self._ignored_exceptions as exc:
+                screen = getattr(exc, 'screen', None)
+                stacktrace = getattr(exc, 'stacktrace', None)
+            if time.monotonic() > end_time:
+                break
+            time.sleep(poll)
+            poll = min(poll * 2, self._poll)
+        raise TimeoutException(message, screen, stacktrace)
+
+
+def network_idle(quiet=0.3, ready_states=('complete',)):
+    """Condition: the page has reached one of ready_states and no jQuery requests have been in flight for `quiet` seconds"""
+    idle_since = None
+
+    def _predicate(driver):
+        nonlocal idle_since
+        busy = driver.execute_script(
+            "return !arguments[0].includes(document.readyState) || (window.jQuery ? window.jQuery.active : 0) > 0;",
+            list(ready_states)
+        )
+        now = time.monotonic()
+        if busy:
+            idle_since = None
+            return False
+        if idle_since is None:
+            idle_since = now
+        return now - idle_since >= quiet
+
+    return _predicate
+
+
+class Timings:
+    """Wall time per named step, shared by every flow in one job"""
+
+    def __init__(self):
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        metrics.browser_step_seconds.observe(seconds, step=name)
+        with self._lock:
+            step = self._steps.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            step['count'] += 1
+            step['total'] += seconds
+            step['max'] = max(step['max'], seconds)
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                name: {
+                    'count': step['count'],
+                    'total': round(step['total'], 3),
+                    'mean': round(step['total'] / step['count'], 3),
+                    'max': round(step['max'], 3),
+                }
+                for name, step in self._steps.items()
+            }
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rq import Queue, SimpleWorker
+
+import jobstore, metrics
+
+QUEUE_NAMES = ('browser', 'extract')
+JOB_TIMEOUTS = {'browser': 60 * 60, 'extract': 10 * 60}
+# RQ_ASYNC=0 runs jobs inline at enqueue time, which is handy with REDIS_URL=fakeredis://
+RQ_ASYNC = os.getenv('RQ_ASYNC', '1') != '0'
+# Port this worker serves its own /metrics on (0 = off); give each worker process its own
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))
+
+
+def get_queue(kind, connection=None):
+    return Queue(
+        kind,
+        connection=connection or jobstore.get_redis(),
+        default_timeout=JOB_TIMEOUTS.get(kind),
+        is_async=RQ_ASYNC
+    )
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port):
+    """Serve this process's metrics, since the jobs it runs never record them in the web process"""
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f'-> Serving worker metrics on :{server.server_port}/metrics')
+    return server
+
+
+def register_gauges(queue_names):
+    """Gauges for state only this worker can see, like the browsers it keeps between jobs"""
+    if 'browser' in queue_names:
+        metrics.gauge('browser_sessions_live', 'Started browser sessions, idle or in use', ['vendor'],
+                      lambda: {vendor: pool.live for vendor, pool in sys.modules['bot'].pools.items()} if 'bot' in sys.modules else {})
+
+
+def main(queue_names):
+    connection = jobstore.get_redis()
+    if WORKER_METRICS_PORT:
+        register_gauges(queue_names)
+        serve_metrics(WORKER_METRICS_PORT)
+    queues = [get_queue(name, connection) for name in queue_names]
+
+    if 'extract' in queue_names:
+        import extract
+        extract.start_parse_pool()
+
+    if 'browser' in queue_names and os.getenv('WARM_DRIVER_POOL') == '1':
+        import bot
+        bot.warm_pools()
+
+    # SimpleWorker runs jobs in this process, so the driver pool and HTTP sessions outlive each job
+    SimpleWorker(queues, connection=connection).work()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or QUEUE_NAMES)